@@ -6,6 +6,10 @@ from service.utils_controller import utils_bp
 from service.train_model_controller import process_requests, train_model_bp
 from service.userinfo_controller import userinfo_bp
 from service.eventjournal_controller import event_bp
+from utils.chroma_migration import start_background_migration
+from utils.index_queue import index_queue
+from utils.schema_migrations import migrate
+from utils.serializers import FastJSONProvider
 from dotenv import load_dotenv
 from flask_swagger_ui import get_swaggerui_blueprint
 from flasgger import Swagger
@@ -16,8 +20,12 @@ import threading
 load_dotenv()
 
 app = Flask(__name__)
+# 以 orjson 輸出 JSON 回應
+app.json = FastJSONProvider(app)
 # 註冊inference的queue
 threading.Thread(target=process_requests, daemon=True, args=(app,)).start()
+# CHROMA_LAYOUT=migrating 時，背景把 per_user collection 搬到 shard
+start_background_migration()
 app.config.from_prefixed_env()
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["SWAGGER"] = {
@@ -37,9 +45,14 @@ app.config["SWAGGER"] = {
 }
 
 # initialize
-CORS(app, resources={r"/*": {"origins": "*"}})
+# 分頁資訊放在回應標頭，需要公開給跨網域的前端讀取
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Next-Cursor", "X-Next-Offset"])
 db.init_app(app)
 jwt.init_app(app)
+# 啟動時套用 schema migration；資料庫版本比程式新時會丟出例外，不會啟動服務
+migrate(app)
+# 啟動向量索引的背景寫入，並排入上次停止前還沒同步的事件
+index_queue.init_app(app)
 
 # Initialize Swagger
 swagger = Swagger(app)
@@ -62,12 +75,6 @@ app.register_blueprint(event_bp, url_prefix="/event")
 app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
 
-# define table
-@app.before_request
-def create_tables():
-    db.create_all()
-
-
 if __name__ == "__main__":
     # app.run(host='0.0.0.0', port=8080, debug=True)
     serve(app, host="0.0.0.0", port=8080)
@@ -0,0 +1,126 @@
+"""
+基準 schema：導入 migration 時已經存在的資料表（取代原本每個 request 前執行的 db.create_all()）。
+
+這裡的定義是當時 schema 的快照，不可以引用 models，之後 model 的異動都要寫成新的 migration，
+全新的資料庫才能依序重播整個歷史。
+"""
+from datetime import timedelta
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    UniqueConstraint,
+    func,
+)
+
+metadata = MetaData()
+
+Table(
+    "user",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("lastname", String(50), nullable=False),
+    Column("firstname", String(50), nullable=False),
+    Column("email", String(255), nullable=False),
+    Column("password", String(255), nullable=False),
+)
+
+Table(
+    "refreshTokens",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("user.id", ondelete="CASCADE"), nullable=False),
+    Column("token", Text, nullable=False),
+    Column("revoked", Boolean),
+)
+
+Table(
+    "user_photo",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, ForeignKey("user.id")),
+    Column("photoname", String(255), nullable=True),
+)
+
+Table(
+    "trained_model",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, ForeignKey("user.id")),
+    Column("modelname", String(50), nullable=False),
+    Column("model_original_name", String(255), nullable=True),
+    Column("modelphoto", String(255), nullable=True),
+    Column("anticipation", Text, nullable=True),
+    Column("start_time", DateTime(timezone=True), nullable=True),
+    Column("end_time", DateTime(timezone=True), nullable=True),
+)
+
+Table(
+    "training_file",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, ForeignKey("user.id")),
+    Column("model_id", Integer, ForeignKey("trained_model.id")),
+    Column("filename", String(50), nullable=False),
+    Column("original_file_name", String(255), nullable=False),
+    Column("start_train", Boolean, nullable=False),
+    Column("is_trained", Boolean, nullable=False),
+    Column("upload_time", DateTime(timezone=True)),
+    Column("error_msg", String(65), nullable=False),
+)
+
+Table(
+    "shared_model",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("create_date", DateTime(timezone=True), nullable=False),
+    Column("model_id", Integer, ForeignKey("trained_model.id"), nullable=False),
+    Column("acquirer_id", Integer, ForeignKey("user.id"), nullable=True),
+    Column("link", String(50), nullable=False),
+)
+
+Table(
+    "password_verification_code",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("email", String(255), nullable=False),
+    Column("verification_code", String(255), nullable=True),
+    Column("created_at", DateTime, server_default=func.now()),
+    Column("expires_at", DateTime, server_default=(func.now() + timedelta(minutes=15))),
+)
+
+Table(
+    "event_journal",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, ForeignKey("user.id"), nullable=False),
+    Column("event_title", String(255), nullable=False),
+    Column("event_content", Text, nullable=False),
+    Column("event_date", DateTime(timezone=True), nullable=False),
+    Column("event_picture", String(255), nullable=False),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Column("updated_at", DateTime(timezone=True), nullable=False),
+)
+
+Table(
+    "event_timeline",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, ForeignKey("user.id"), nullable=False),
+    Column("year", Integer, nullable=False),
+    Column("month", Integer, nullable=False),
+    Column("event_count", Integer, nullable=False),
+    UniqueConstraint("user_id", "year", "month", name="uq_event_timeline_user_id_year_month"),
+)
+
+
+def upgrade(connection):
+    # 已經存在的表不會重建，既有的資料庫也可以直接套用
+    metadata.create_all(bind=connection, checkfirst=True)
@@ -0,0 +1,16 @@
+"""event_journal (user_id, event_date) 複合索引；之前建立的資料庫沒有這個索引"""
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, Table
+
+# 只需要索引用到的欄位，不可以引用 models（model 之後可能再改變）
+event_journal = Table(
+    "event_journal",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer),
+    Column("event_date", DateTime(timezone=True)),
+)
+index = Index("ix_event_journal_user_id_event_date", event_journal.c.user_id, event_journal.c.event_date)
+
+
+def upgrade(connection):
+    index.create(bind=connection, checkfirst=True)
@@ -0,0 +1,82 @@
+"""
+事件全文檢索索引（PostgreSQL：pg_trgm / tsvector；SQLite：FTS5）。
+
+repository.event_search_repo 的查詢必須和這裡的 PG_DOCUMENT 運算式相同才會用到索引，由它從這裡匯入。
+"""
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+# 建立當時的定義，不可以引用 repository 或 models（之後可能再改變）
+
+# PostgreSQL：標題與內容合併後的全文檢索欄位（索引和查詢必須使用相同的運算式）
+PG_DOCUMENT = "(event_title || ' ' || event_content)"
+
+PG_TRGM_EXTENSION = "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+# 中文沒有空白斷詞，以 trigram 處理任意子字串（LIKE/ILIKE 也會用到這個索引），需要 pg_trgm
+PG_TRGM_INDEX = f"CREATE INDEX IF NOT EXISTS ix_event_journal_search_trgm ON event_journal USING gin ({PG_DOCUMENT} gin_trgm_ops)"
+# 英文等以空白斷詞的內容
+PG_TSV_INDEX = f"CREATE INDEX IF NOT EXISTS ix_event_journal_search_tsv ON event_journal USING gin (to_tsvector('simple', {PG_DOCUMENT}))"
+
+# SQLite：external content 的 FTS5 表，以 trigger 和 event_journal 同步
+SQLITE_FTS_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS event_journal_fts USING fts5("
+    "event_title, event_content, content='event_journal', content_rowid='id', tokenize='trigram')"
+)
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS event_journal_fts_insert AFTER INSERT ON event_journal BEGIN
+        INSERT INTO event_journal_fts(rowid, event_title, event_content)
+        VALUES (new.id, new.event_title, new.event_content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS event_journal_fts_delete AFTER DELETE ON event_journal BEGIN
+        INSERT INTO event_journal_fts(event_journal_fts, rowid, event_title, event_content)
+        VALUES ('delete', old.id, old.event_title, old.event_content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS event_journal_fts_update AFTER UPDATE ON event_journal BEGIN
+        INSERT INTO event_journal_fts(event_journal_fts, rowid, event_title, event_content)
+        VALUES ('delete', old.id, old.event_title, old.event_content);
+        INSERT INTO event_journal_fts(rowid, event_title, event_content)
+        VALUES (new.id, new.event_title, new.event_content);
+    END""",
+]
+
+
+def create_search_index(connection):
+    """
+    建立全文檢索索引（已存在時不會重建）。
+
+    SQLite 第一次建立時會把既有的事件加入索引，之後由 trigger 同步。
+
+    PostgreSQL 的 CREATE EXTENSION pg_trgm 需要資料庫擁有者（或 superuser）權限。
+    權限不足時只記錄警告、不建立 trigram 索引，搜尋改用 LIKE，不會讓服務無法啟動；
+    之後由有權限的帳號執行 PG_TRGM_EXTENSION 和 PG_TRGM_INDEX，重新啟動後就會使用 trigram 搜尋。
+    """
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        try:
+            # savepoint：失敗時只復原這一步，migration 的交易可以繼續
+            with connection.begin_nested():
+                connection.execute(text(PG_TRGM_EXTENSION))
+                connection.execute(text(PG_TRGM_INDEX))
+        except DBAPIError as e:
+            logging.warning(
+                f"pg_trgm is not available ({e.orig}); event search falls back to LIKE. "
+                f"Run as a privileged role: {PG_TRGM_EXTENSION}; {PG_TRGM_INDEX}"
+            )
+        connection.execute(text(PG_TSV_INDEX))
+    elif dialect == "sqlite":
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'event_journal_fts'")
+        ).first()
+        connection.execute(text(SQLITE_FTS_TABLE))
+        for statement in SQLITE_TRIGGERS:
+            connection.execute(text(statement))
+        if not exists:
+            connection.execute(
+                text("INSERT INTO event_journal_fts(event_journal_fts) VALUES ('rebuild')")
+            )
+
+
+def upgrade(connection):
+    create_search_index(connection)
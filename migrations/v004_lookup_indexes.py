@@ -0,0 +1,38 @@
+"""常用查詢路徑的索引（信箱、模型、訓練檔、分享連結、refresh token、驗證碼、大頭貼）；之前建立的資料庫沒有這些索引"""
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, Text
+
+# 只需要索引用到的欄位，不可以引用 models（model 之後可能再改變）
+metadata = MetaData()
+user = Table("user", metadata, Column("id", Integer, primary_key=True), Column("email", String(255)))
+refresh_tokens = Table(
+    "refreshTokens", metadata, Column("id", Integer, primary_key=True), Column("user_id", Integer), Column("token", Text)
+)
+trained_model = Table(
+    "trained_model", metadata, Column("id", Integer, primary_key=True), Column("user_id", Integer), Column("modelname", String(50))
+)
+training_file = Table(
+    "training_file", metadata, Column("id", Integer, primary_key=True), Column("user_id", Integer), Column("model_id", Integer)
+)
+shared_model = Table(
+    "shared_model", metadata, Column("id", Integer, primary_key=True), Column("link", String(50)), Column("acquirer_id", Integer)
+)
+password_verification_code = Table(
+    "password_verification_code", metadata, Column("id", Integer, primary_key=True), Column("email", String(255))
+)
+user_photo = Table("user_photo", metadata, Column("id", Integer, primary_key=True), Column("user_id", Integer))
+
+indexes = [
+    Index("ix_user_email", user.c.email),
+    Index("ix_refresh_tokens_user_id_token", refresh_tokens.c.user_id, refresh_tokens.c.token),
+    Index("ix_trained_model_user_id_modelname", trained_model.c.user_id, trained_model.c.modelname),
+    Index("ix_training_file_user_id_model_id", training_file.c.user_id, training_file.c.model_id),
+    Index("ix_shared_model_link", shared_model.c.link),
+    Index("ix_shared_model_acquirer_id", shared_model.c.acquirer_id),
+    Index("ix_password_verification_code_email", password_verification_code.c.email),
+    Index("ix_user_photo_user_id", user_photo.c.user_id),
+]
+
+
+def upgrade(connection):
+    for index in indexes:
+        index.create(bind=connection, checkfirst=True)
@@ -0,0 +1,18 @@
+"""向量索引的 outbox 表：事件異動和待同步紀錄在同一個交易中寫入，重新啟動後可以繼續同步"""
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, MetaData, Table
+
+# 建立當時的定義，不可以引用 models（model 之後可能再改變）
+event_index_outbox = Table(
+    "event_index_outbox",
+    MetaData(),
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("event_id", Integer, nullable=False),
+    Column("user_id", Integer, nullable=False),
+    Column("failed", Boolean, nullable=False),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Index("ix_event_index_outbox_event_id", "event_id"),
+)
+
+
+def upgrade(connection):
+    event_index_outbox.create(bind=connection, checkfirst=True)
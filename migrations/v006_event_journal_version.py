@@ -0,0 +1,16 @@
+"""每個使用者事件最後一次異動的時間（事件列表的 Last-Modified，刪除事件也會更新）"""
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, MetaData, Table
+
+# 建立當時的定義，不可以引用 models（model 之後可能再改變）
+metadata = MetaData()
+Table("user", metadata, Column("id", Integer, primary_key=True))
+event_journal_version = Table(
+    "event_journal_version",
+    metadata,
+    Column("user_id", Integer, ForeignKey("user.id"), primary_key=True),
+    Column("changed_at", DateTime(timezone=True), nullable=False),
+)
+
+
+def upgrade(connection):
+    event_journal_version.create(bind=connection, checkfirst=True)
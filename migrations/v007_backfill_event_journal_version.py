@@ -0,0 +1,29 @@
+"""為已經有事件、但還沒有異動紀錄的使用者補上 event_journal_version，列表的 Last-Modified 只需要讀這一列"""
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, func, select
+
+# 建立當時的定義，不可以引用 models（model 之後可能再改變）
+metadata = MetaData()
+event_journal = Table(
+    "event_journal",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=False),
+    Column("updated_at", DateTime(timezone=True), nullable=False),
+)
+event_journal_version = Table(
+    "event_journal_version",
+    metadata,
+    Column("user_id", Integer, primary_key=True),
+    Column("changed_at", DateTime(timezone=True), nullable=False),
+)
+
+
+def upgrade(connection):
+    missing = (
+        select(event_journal.c.user_id, func.max(event_journal.c.updated_at))
+        .where(event_journal.c.user_id.not_in(select(event_journal_version.c.user_id)))
+        .group_by(event_journal.c.user_id)
+    )
+    connection.execute(
+        event_journal_version.insert().from_select(["user_id", "changed_at"], missing)
+    )
@@ -0,0 +1,59 @@
+"""以事件資料重新計算 event_timeline 的每月數量，之後由事件的異動同步增減，時間軸不需要再檢查或重算"""
+from collections import Counter
+from datetime import date, datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, select
+
+# 建立當時的定義，不可以引用 models（model 之後可能再改變）
+metadata = MetaData()
+event_journal = Table(
+    "event_journal",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=False),
+    Column("event_date", DateTime(timezone=True), nullable=False),
+)
+event_timeline = Table(
+    "event_timeline",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", Integer, nullable=False),
+    Column("year", Integer, nullable=False),
+    Column("month", Integer, nullable=False),
+    Column("event_count", Integer, nullable=False),
+)
+# 一次寫入的筆數
+BATCH_SIZE = 1000
+
+
+def month_of(event_date):
+    """建立當時 repository.event_timeline_repo.month_of 的規則：一律以 UTC 計算，SQLite 讀回的時間視為 UTC"""
+    if isinstance(event_date, str):
+        try:
+            event_date = datetime.fromisoformat(event_date)
+        except ValueError:
+            return None
+    if isinstance(event_date, datetime) and event_date.tzinfo is not None:
+        event_date = event_date.astimezone(timezone.utc)
+    if isinstance(event_date, (datetime, date)):
+        return event_date.year, event_date.month
+    return None
+
+
+def upgrade(connection):
+    counts = Counter()
+    rows = connection.execution_options(yield_per=BATCH_SIZE).execute(
+        select(event_journal.c.user_id, event_journal.c.event_date)
+    )
+    for user_id, event_date in rows:
+        month = month_of(event_date)
+        if month is not None:
+            counts[(user_id, *month)] += 1
+
+    connection.execute(event_timeline.delete())
+    values = [
+        {"user_id": user_id, "year": year, "month": month, "event_count": count}
+        for (user_id, year, month), count in counts.items()
+    ]
+    for start in range(0, len(values), BATCH_SIZE):
+        connection.execute(event_timeline.insert(), values[start:start + BATCH_SIZE])
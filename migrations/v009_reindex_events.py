@@ -0,0 +1,40 @@
+"""
+把所有既有事件排入向量索引的 outbox。
+
+event_day 等 metadata 是之後才加入的欄位，只有重新同步的事件才會寫入，
+不重新索引的話日期過濾會漏掉較舊的事件。server 啟動時會排入這些紀錄，
+內容沒變的事件只更新 metadata，不會重新 embedding。
+"""
+from sqlalchemy import Boolean, Column, DateTime, Integer, MetaData, Table, func, literal, select
+
+# 建立當時的定義，不可以引用 models（model 之後可能再改變）
+metadata = MetaData()
+event_journal = Table(
+    "event_journal",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=False),
+)
+event_index_outbox = Table(
+    "event_index_outbox",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("event_id", Integer, nullable=False),
+    Column("user_id", Integer, nullable=False),
+    Column("failed", Boolean, nullable=False),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+)
+
+
+def upgrade(connection):
+    connection.execute(
+        event_index_outbox.insert().from_select(
+            ["event_id", "user_id", "failed", "created_at"],
+            select(
+                event_journal.c.id,
+                event_journal.c.user_id,
+                literal(False, Boolean),
+                func.now(),
+            ),
+        )
+    )
@@ -0,0 +1,27 @@
+from sqlalchemy import DateTime, func
+from extensions import db
+
+
+class EventIndexOutbox(db.Model):
+    """
+    尚未同步到向量資料庫的事件異動。
+
+    和事件的新增、修改、刪除在同一個交易中寫入，同步完成後才刪除，
+    重新啟動後可以從這裡繼續處理；沒有紀錄代表事件已經同步完成。
+    """
+    __tablename__ = 'event_index_outbox'
+    __table_args__ = (
+        db.Index('ix_event_index_outbox_event_id', 'event_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # 不設外鍵，事件刪除後仍要保留紀錄以刪除向量資料
+    event_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    # 重試次數用完仍失敗，等待定期重試
+    failed = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(DateTime(timezone=True), default=func.now(), nullable=False)
+
+    def __init__(self, user_id, event_id):
+        self.user_id = user_id
+        self.event_id = event_id
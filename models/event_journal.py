@@ -4,6 +4,10 @@ from extensions import db
 
 class EventJournal(db.Model):
     __tablename__ = 'event_journal'
+    __table_args__ = (
+        # 依使用者查詢並以日期排序、做日期區間查詢都靠這個索引
+        db.Index('ix_event_journal_user_id_event_date', 'user_id', 'event_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # 假設你有一個 users 表
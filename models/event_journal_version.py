@@ -0,0 +1,14 @@
+from sqlalchemy import DateTime
+from extensions import db
+
+
+class EventJournalVersion(db.Model):
+    """每個使用者的事件最後一次異動（新增、修改、刪除）的時間，作為事件列表的 Last-Modified"""
+    __tablename__ = 'event_journal_version'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    changed_at = db.Column(DateTime(timezone=True), nullable=False)
+
+    def __init__(self, user_id, changed_at):
+        self.user_id = user_id
+        self.changed_at = changed_at
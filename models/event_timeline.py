@@ -0,0 +1,21 @@
+from extensions import db
+
+
+class EventTimeline(db.Model):
+    """每個使用者每個月份的事件數量，事件新增、修改、刪除時同步更新"""
+    __tablename__ = 'event_timeline'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'year', 'month', name='uq_event_timeline_user_id_year_month'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    event_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, user_id, year, month, event_count=0):
+        self.user_id = user_id
+        self.year = year
+        self.month = month
+        self.event_count = event_count
@@ -5,6 +5,10 @@ from extensions import db
 
 class PasswordVerificationCode(db.Model):
     __tablename__ = "password_verification_code"
+    __table_args__ = (
+        # 忘記密碼、重設密碼以信箱查詢驗證碼
+        db.Index("ix_password_verification_code_email", "email"),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     email = db.Column(db.String(255), nullable=False)
     verification_code = db.Column(db.String(255), nullable=True)
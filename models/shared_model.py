@@ -5,6 +5,12 @@ import uuid
 
 class SharedModel(db.Model):
     __tablename__ = "shared_model"
+    __table_args__ = (
+        # 以分享連結取得模型
+        db.Index("ix_shared_model_link", "link"),
+        # 列出使用者取得的模型
+        db.Index("ix_shared_model_acquirer_id", "acquirer_id"),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     create_date: DateTime = db.Column(
         DateTime(timezone=True), nullable=False, default=func.now()
@@ -6,6 +6,10 @@ import uuid
 
 class TrainedModel(db.Model):
     __tablename__ = "trained_model"
+    __table_args__ = (
+        # 聊天、分享以 (user_id, modelname) 查詢模型；只有 user_id 的查詢也可以使用
+        db.Index("ix_trained_model_user_id_modelname", "user_id", "modelname"),
+    )
     id: int = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id: int = db.Column(db.Integer, db.ForeignKey("user.id"))
     modelname: str = db.Column(db.String(50), nullable=False)
@@ -5,6 +5,10 @@ import uuid
 
 class TrainingFile(db.Model):
     __tablename__ = "training_file"
+    __table_args__ = (
+        # 上傳與訓練以 (user_id, model_id) 查詢訓練檔；只有 user_id 的查詢也可以使用
+        db.Index("ix_training_file_user_id_model_id", "user_id", "model_id"),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     model_id = db.Column(db.Integer, db.ForeignKey("trained_model.id"))
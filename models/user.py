@@ -4,6 +4,10 @@ from werkzeug.security import generate_password_hash, check_password_hash
 
 class User(db.Model):
     __tablename__ = "user"
+    __table_args__ = (
+        # 登入、舊 token 與忘記密碼都以信箱查詢使用者
+        db.Index("ix_user_email", "email"),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     lastname = db.Column(db.String(50), nullable=False)
     firstname = db.Column(db.String(50), nullable=False)
@@ -84,6 +88,10 @@ class User(db.Model):
 
 class RefreshToken(db.Model):
     __tablename__ = "refreshTokens"
+    __table_args__ = (
+        # 刷新 token 以 (user_id, token) 查詢；只有 user_id 的查詢也可以使用
+        db.Index("ix_refresh_tokens_user_id_token", "user_id", "token"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(
@@ -2,6 +2,10 @@ from extensions import db
 
 class UserPhoto(db.Model):
     __tablename__ = "user_photo"
+    __table_args__ = (
+        # 登入和上傳大頭貼時以 user_id 查詢
+        db.Index("ix_user_photo_user_id", "user_id"),
+    )
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     photoname = db.Column(db.String(255), nullable=True)
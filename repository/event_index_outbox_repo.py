@@ -0,0 +1,128 @@
+import logging
+
+from sqlalchemy import Boolean, and_, func, insert, literal, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from models.event_index_outbox import EventIndexOutbox
+from models.event_journal import EventJournal
+
+
+def _up_to(latest_ids):
+    """每個事件 id 不超過 latest_ids 所記錄版本的紀錄（之後才寫入的紀錄不包含在內）"""
+    return or_(
+        *[
+            and_(EventIndexOutbox.event_id == event_id, EventIndexOutbox.id <= outbox_id)
+            for event_id, outbox_id in latest_ids.items()
+        ]
+    )
+
+
+class EventIndexOutboxRepository:
+    @staticmethod
+    def record(user_id, event_ids):
+        """記錄需要同步的事件。不會 commit，由呼叫端和事件的異動一起 commit"""
+        db.session.add_all(EventIndexOutbox(user_id, event_id) for event_id in event_ids)
+
+    @staticmethod
+    def record_all():
+        """把所有事件記錄為需要同步（重新索引），回傳筆數"""
+        try:
+            result = db.session.execute(
+                insert(EventIndexOutbox).from_select(
+                    ["event_id", "user_id", "failed", "created_at"],
+                    select(EventJournal.id, EventJournal.user_id, literal(False, Boolean), func.now()),
+                )
+            )
+            db.session.commit()
+            return result.rowcount
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Error queueing all events for re-indexing: {e}")
+            raise e
+
+    @staticmethod
+    def latest_ids(event_ids):
+        """
+        取得每個事件目前最新一筆紀錄的 id。
+
+        Returns:
+        - dict: {event_id: outbox_id}，只包含還有紀錄（尚未同步）的事件。
+        """
+        if not event_ids:
+            return {}
+        return dict(
+            db.session.query(EventIndexOutbox.event_id, func.max(EventIndexOutbox.id))
+            .filter(EventIndexOutbox.event_id.in_(event_ids))
+            .group_by(EventIndexOutbox.event_id)
+            .all()
+        )
+
+    @staticmethod
+    def complete(latest_ids):
+        """同步完成後刪除紀錄"""
+        if not latest_ids:
+            return
+        try:
+            EventIndexOutbox.query.filter(_up_to(latest_ids)).delete(synchronize_session=False)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Error completing index outbox for events {list(latest_ids)}: {e}")
+            raise e
+
+    @staticmethod
+    def mark_failed(latest_ids):
+        """重試次數用完仍失敗，標記後等待定期重試"""
+        if not latest_ids:
+            return
+        try:
+            EventIndexOutbox.query.filter(_up_to(latest_ids)).update(
+                {EventIndexOutbox.failed: True}, synchronize_session=False
+            )
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Error marking index outbox failed for events {list(latest_ids)}: {e}")
+            raise e
+
+    @staticmethod
+    def get_pending():
+        """還沒同步、也沒有標記失敗的事件：[(user_id, event_id)]"""
+        return (
+            db.session.query(EventIndexOutbox.user_id, EventIndexOutbox.event_id)
+            .filter(EventIndexOutbox.failed.is_(False))
+            .distinct()
+            .all()
+        )
+
+    @staticmethod
+    def retry_failed():
+        """清除失敗標記，回傳需要重新同步的事件：[(user_id, event_id)]"""
+        try:
+            rows = (
+                db.session.query(EventIndexOutbox.id, EventIndexOutbox.user_id, EventIndexOutbox.event_id)
+                .filter(EventIndexOutbox.failed.is_(True))
+                .all()
+            )
+            if rows:
+                # 只清除查到的紀錄，之後才失敗的紀錄等下一輪
+                EventIndexOutbox.query.filter(EventIndexOutbox.id.in_([row.id for row in rows])).update(
+                    {EventIndexOutbox.failed: False}, synchronize_session=False
+                )
+            db.session.commit()
+            return list(dict.fromkeys((row.user_id, row.event_id) for row in rows))
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Error retrying failed index outbox: {e}")
+            raise e
+
+    @staticmethod
+    def get_failed_flags(event_id):
+        """事件尚未同步的紀錄各自是否已標記失敗；空列表代表已經同步完成"""
+        return [
+            failed
+            for (failed,) in db.session.query(EventIndexOutbox.failed)
+            .filter(EventIndexOutbox.event_id == event_id)
+            .all()
+        ]
@@ -1,11 +1,29 @@
 import logging
+from datetime import datetime
 
-from sqlalchemy import and_, extract
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
 from extensions import db
 from models.event_journal import EventJournal
+from repository.event_index_outbox_repo import EventIndexOutboxRepository
+from repository.event_journal_version_repo import EventJournalVersionRepository
+from repository.event_timeline_repo import EventTimelineRepository
 from sqlalchemy.exc import SQLAlchemyError
 
 class EventJournalRepository:
+    @staticmethod
+    def _stored_event_dates(event_ids):
+        """flush 後從資料庫讀回事件日期，時間軸的月份一律以資料庫中的值計算"""
+        if not event_ids:
+            return []
+        db.session.flush()
+        return [
+            event_date
+            for (event_date,) in db.session.query(EventJournal.event_date).filter(
+                EventJournal.id.in_(event_ids)
+            ).all()
+        ]
+
     @staticmethod
     def create_event(user_id, event_title, event_content, event_date, event_picture):
         """新增一個事件記錄"""
@@ -18,6 +36,12 @@ class EventJournalRepository:
                 event_picture=event_picture
             )
             db.session.add(new_event)
+            db.session.flush()
+            EventTimelineRepository.record(
+                user_id, added=EventJournalRepository._stored_event_dates([new_event.id])
+            )
+            EventIndexOutboxRepository.record(user_id, [new_event.id])
+            EventJournalVersionRepository.touch(user_id)
             db.session.commit()
             return new_event
         except SQLAlchemyError as e:
@@ -25,6 +49,107 @@ class EventJournalRepository:
             logging.error(f"Error creating event: {e}")
             raise e
 
+    @staticmethod
+    def bulk_create_events(user_id, rows):
+        """在同一個交易中批次新增事件記錄"""
+        if not rows:
+            # 沒有寫入任何事件，不更新異動時間，快取仍然有效
+            return []
+        try:
+            events = [
+                EventJournal(
+                    user_id=user_id,
+                    event_title=row["event_title"],
+                    event_content=row["event_content"],
+                    event_date=row["event_date"],
+                    event_picture=row["event_picture"]
+                )
+                for row in rows
+            ]
+            db.session.add_all(events)
+            db.session.flush()
+            event_ids = [event.id for event in events]
+            EventTimelineRepository.record(
+                user_id, added=EventJournalRepository._stored_event_dates(event_ids)
+            )
+            EventIndexOutboxRepository.record(user_id, event_ids)
+            EventJournalVersionRepository.touch(user_id)
+            db.session.commit()
+            # commit 後屬性會失效，用一次查詢重新載入，避免逐筆 refresh
+            EventJournal.query.filter(EventJournal.id.in_(event_ids)).all()
+            return events
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Error bulk creating events for user ID {user_id}: {e}")
+            raise e
+
+    @staticmethod
+    def bulk_update_events(user_id, rows, updated_at=None):
+        """在同一個交易中批次更新事件，只會更新屬於該使用者的事件，回傳 {event_id: event}"""
+        try:
+            event_ids = [row["event_id"] for row in rows]
+            events = {
+                event.id: event
+                for event in EventJournal.query.filter(
+                    EventJournal.user_id == user_id,
+                    EventJournal.id.in_(event_ids)
+                ).all()
+            }
+            moved_ids, removed = [], []
+            for row in rows:
+                event = events.get(row["event_id"])
+                if event is None:
+                    continue
+                if row.get("event_date"):
+                    # 原本的日期是從資料庫讀出的值；新的日期寫入後再讀回
+                    removed.append(event.event_date)
+                    moved_ids.append(event.id)
+                for field in ("event_title", "event_content", "event_date", "event_picture"):
+                    if row.get(field):
+                        setattr(event, field, row[field])
+                if updated_at:
+                    event.updated_at = updated_at
+            if not events:
+                # 沒有任何屬於該使用者的事件被更新，不更新異動時間，快取仍然有效
+                return events
+            EventTimelineRepository.record(
+                user_id, added=EventJournalRepository._stored_event_dates(moved_ids), removed=removed
+            )
+            EventIndexOutboxRepository.record(user_id, list(events))
+            EventJournalVersionRepository.touch(user_id)
+            db.session.commit()
+            EventJournal.query.filter(EventJournal.id.in_(list(events))).all()
+            return events
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Error bulk updating events for user ID {user_id}: {e}")
+            raise e
+
+    @staticmethod
+    def bulk_delete_events(user_id, event_ids):
+        """在同一個交易中批次刪除事件，只會刪除屬於該使用者的事件，回傳被刪除的事件ID"""
+        try:
+            existing = dict(
+                db.session.query(EventJournal.id, EventJournal.event_date).filter(
+                    EventJournal.user_id == user_id,
+                    EventJournal.id.in_(event_ids)
+                ).all()
+            )
+            existing_ids = set(existing)
+            if existing_ids:
+                EventJournal.query.filter(
+                    EventJournal.id.in_(existing_ids)
+                ).delete(synchronize_session=False)
+                EventTimelineRepository.record(user_id, removed=existing.values())
+                EventIndexOutboxRepository.record(user_id, existing_ids)
+                EventJournalVersionRepository.touch(user_id)
+            db.session.commit()
+            return existing_ids
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Error bulk deleting events for user ID {user_id}: {e}")
+            raise e
+
     @staticmethod
     def get_event_by_event_id(event_id):
         """根據事件ID取得事件"""
@@ -43,6 +168,65 @@ class EventJournalRepository:
             logging.error(f"Error retrieving events for user ID {user_id}: {e}")
             raise e
 
+    @staticmethod
+    def get_events_page(user_id, limit, after=None, columns=None, start=None, end=None):
+        """
+        以 (event_date, id) 做 keyset 分頁，依日期由舊到新取得使用者的事件。
+
+        Parameters:
+        - limit (int): 這一頁最多幾筆；None 表示不分頁，一次取得全部。
+        - after (tuple): 上一頁最後一筆的 (event_date, id)；None 表示第一頁。
+        - columns (list): 只載入這些欄位名稱；None 表示全部載入。
+        - start, end (datetime): 事件日期的半開區間 [start, end)，None 表示不限制。
+
+        Returns:
+        - (events, has_more)
+        """
+        try:
+            query = EventJournal.query.filter(
+                EventJournalRepository._date_range_filter(user_id, start, end)
+            )
+            if after is not None:
+                after_date, after_id = after
+                query = query.filter(
+                    or_(
+                        EventJournal.event_date > after_date,
+                        and_(EventJournal.event_date == after_date, EventJournal.id > after_id)
+                    )
+                )
+            if columns:
+                # 分頁游標一定要用到 id 和 event_date
+                names = {"id", "event_date", *columns}
+                query = query.options(load_only(*[getattr(EventJournal, name) for name in names]))
+            query = query.order_by(EventJournal.event_date.asc(), EventJournal.id.asc())
+            if limit is None:
+                return query.all(), False
+            # 多取一筆判斷是否還有下一頁
+            events = query.limit(limit + 1).all()
+            return events[:limit], len(events) > limit
+        except SQLAlchemyError as e:
+            logging.error(f"Error retrieving event page for user ID {user_id}: {e}")
+            raise e
+
+    @staticmethod
+    def get_events_by_ids(user_id, event_ids, columns=None):
+        """以一次查詢取得多個事件，依 event_ids 的順序回傳（只包含屬於該使用者的事件）"""
+        if not event_ids:
+            return []
+        try:
+            query = EventJournal.query.filter(
+                EventJournal.user_id == user_id, EventJournal.id.in_(event_ids)
+            )
+            if columns:
+                query = query.options(
+                    load_only(*[getattr(EventJournal, name) for name in {"id", *columns}])
+                )
+            events = {event.id: event for event in query.all()}
+            return [events[event_id] for event_id in event_ids if event_id in events]
+        except SQLAlchemyError as e:
+            logging.error(f"Error retrieving events {event_ids} for user ID {user_id}: {e}")
+            raise e
+
     @staticmethod
     def update_event(event_id, event_title=None, event_content=None, updated_at=None, event_date=None ,event_picture=None):
         """更新一個事件的標題或內容"""
@@ -57,9 +241,17 @@ class EventJournalRepository:
             if updated_at:
                 event.updated_at = updated_at
             if event_date:
+                removed = [event.event_date]
                 event.event_date = event_date
+                EventTimelineRepository.record(
+                    event.user_id,
+                    added=EventJournalRepository._stored_event_dates([event.id]),
+                    removed=removed,
+                )
             if event_picture:
                 event.event_picture = event_picture
+            EventIndexOutboxRepository.record(event.user_id, [event.id])
+            EventJournalVersionRepository.touch(event.user_id)
             db.session.commit()
             return event
         except SQLAlchemyError as e:
@@ -74,6 +266,9 @@ class EventJournalRepository:
             event = EventJournal.query.filter_by(id=event_id).first()
             if event:
                 db.session.delete(event)
+                EventTimelineRepository.record(event.user_id, removed=[event.event_date])
+                EventIndexOutboxRepository.record(event.user_id, [event.id])
+                EventJournalVersionRepository.touch(event.user_id)
                 db.session.commit()
                 return True
             return False
@@ -81,16 +276,44 @@ class EventJournalRepository:
             db.session.rollback()
             logging.error(f"Error deleting event with ID {event_id}: {e}")
             raise e
+
+    @staticmethod
+    def _date_range_filter(user_id, start=None, end=None):
+        """
+        使用者ID加上事件日期半開區間 [start, end) 的條件。
+
+        直接比較 event_date 欄位（不對欄位套用函式），才能用到 (user_id, event_date) 索引。
+        """
+        conditions = [EventJournal.user_id == user_id]
+        if start is not None:
+            conditions.append(EventJournal.event_date >= start)
+        if end is not None:
+            conditions.append(EventJournal.event_date < end)
+        return and_(*conditions)
+
     @staticmethod
-    def get_events_by_date(user_id, target_year):
-        """根據使用者ID和日期取得事件"""
+    def get_events_by_date_range(user_id, start=None, end=None):
+        """根據使用者ID取得事件日期在 [start, end) 之間的事件"""
         try:
             return EventJournal.query.filter(
-                        and_(
-                            EventJournal.user_id == user_id,
-                            extract('year', EventJournal.event_date) == target_year
-                        )
-                    ).order_by(EventJournal.event_date.asc()).all()        
+                        EventJournalRepository._date_range_filter(user_id, start, end)
+                    ).order_by(EventJournal.event_date.asc(), EventJournal.id.asc()).all()
         except SQLAlchemyError as e:
-            logging.error(f"Error retrieving event with user ID {user_id} and the year if {target_year}: {e}")
-            raise e
\ No newline at end of file
+            logging.error(f"Error retrieving events for user ID {user_id} between {start} and {end}: {e}")
+            raise e
+
+    @staticmethod
+    def date_range_of(target_year, target_month=None):
+        """年份（以及月份）對應的半開區間 (start, end)"""
+        if target_month is None:
+            return datetime(target_year, 1, 1), datetime(target_year + 1, 1, 1)
+        return (
+            datetime(target_year, target_month, 1),
+            datetime(target_year + target_month // 12, target_month % 12 + 1, 1),
+        )
+
+    @staticmethod
+    def get_events_by_date(user_id, target_year, target_month=None):
+        """根據使用者ID和年份（以及月份）取得事件"""
+        start, end = EventJournalRepository.date_range_of(target_year, target_month)
+        return EventJournalRepository.get_events_by_date_range(user_id, start, end)
\ No newline at end of file
@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+
+from extensions import db
+from models.event_journal_version import EventJournalVersion
+from repository.event_timeline_repo import UPSERT_INSERTS
+
+
+class EventJournalVersionRepository:
+    @staticmethod
+    def touch(user_id, changed_at=None):
+        """
+        記錄使用者的事件有異動。不會 commit，由呼叫端和事件的異動一起 commit。
+
+        刪除事件、把事件移出某個日期區間都不會改變剩下事件的 updated_at，
+        所以列表的 Last-Modified 要以這個時間為準。
+        """
+        changed_at = changed_at or datetime.now(timezone.utc)
+        insert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+        if insert is not None:
+            statement = insert(EventJournalVersion).values(user_id=user_id, changed_at=changed_at)
+            db.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=["user_id"], set_={"changed_at": changed_at}
+                )
+            )
+            return
+        version = db.session.get(EventJournalVersion, user_id, with_for_update=True)
+        if version is None:
+            db.session.add(EventJournalVersion(user_id, changed_at))
+        else:
+            version.changed_at = changed_at
+
+    @staticmethod
+    def get_changed_at(user_id):
+        """
+        使用者事件最後一次異動的時間，只以主鍵讀取一列，不會掃描事件。
+
+        已有事件的使用者由 migration 補上紀錄，之後每次異動都會更新。
+
+        Returns:
+        - datetime: 從來沒有異動過時返回 None。
+        """
+        return (
+            db.session.query(EventJournalVersion.changed_at)
+            .filter(EventJournalVersion.user_id == user_id)
+            .scalar()
+        )
@@ -0,0 +1,110 @@
+import logging
+
+from sqlalchemy import case, or_, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from migrations.v003_event_search_index import PG_DOCUMENT
+from models.event_journal import EventJournal
+
+# trigram 至少需要 3 個字元，較短的查詢改用 LIKE
+MIN_TRIGRAM_LENGTH = 3
+
+# PostgreSQL 是否已安裝 pg_trgm（每個 process 查詢一次）
+_has_pg_trgm = None
+
+
+def _escape_like(query):
+    return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class EventSearchRepository:
+    @staticmethod
+    def dialect():
+        return db.session.get_bind().dialect.name
+
+    @staticmethod
+    def has_pg_trgm():
+        global _has_pg_trgm
+        if _has_pg_trgm is None:
+            _has_pg_trgm = db.session.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).first() is not None
+        return _has_pg_trgm
+
+    @staticmethod
+    def search(user_id, query, limit, offset=0):
+        """
+        以標題和內容全文檢索使用者的事件，依相關程度排序。
+
+        Returns:
+        - (event_ids, has_more)：event_ids 依相關程度排序。
+        """
+        try:
+            dialect = EventSearchRepository.dialect()
+            if dialect == "postgresql" and EventSearchRepository.has_pg_trgm():
+                rows = EventSearchRepository._search_postgresql(user_id, query, limit + 1, offset)
+            elif dialect == "sqlite" and len(query) >= MIN_TRIGRAM_LENGTH:
+                rows = EventSearchRepository._search_sqlite(user_id, query, limit + 1, offset)
+            else:
+                rows = EventSearchRepository._search_like(user_id, query, limit + 1, offset)
+            event_ids = [row[0] for row in rows]
+            return event_ids[:limit], len(event_ids) > limit
+        except SQLAlchemyError as e:
+            logging.error(f"Error searching events for user ID {user_id}: {e}")
+            raise e
+
+    @staticmethod
+    def _search_postgresql(user_id, query, limit, offset):
+        return db.session.execute(
+            text(
+                f"""
+                SELECT id,
+                       ts_rank_cd(to_tsvector('simple', {PG_DOCUMENT}), plainto_tsquery('simple', :query))
+                       + word_similarity(:query, {PG_DOCUMENT}) AS rank
+                FROM event_journal
+                WHERE user_id = :user_id
+                  AND ({PG_DOCUMENT} ILIKE :pattern
+                       OR to_tsvector('simple', {PG_DOCUMENT}) @@ plainto_tsquery('simple', :query))
+                ORDER BY rank DESC, id DESC
+                LIMIT :limit OFFSET :offset
+                """
+            ),
+            {
+                "user_id": user_id,
+                "query": query,
+                "pattern": f"%{_escape_like(query)}%",
+                "limit": limit,
+                "offset": offset,
+            },
+        ).all()
+
+    @staticmethod
+    def _search_sqlite(user_id, query, limit, offset):
+        # 整個查詢當成一個片語，避免使用者輸入被解析成 FTS5 語法；標題的權重較高
+        phrase = '"' + query.replace('"', '""') + '"'
+        return db.session.execute(
+            text(
+                """
+                SELECT event_journal.id, bm25(event_journal_fts, 2.0, 1.0) AS rank
+                FROM event_journal_fts
+                JOIN event_journal ON event_journal.id = event_journal_fts.rowid
+                WHERE event_journal_fts MATCH :phrase AND event_journal.user_id = :user_id
+                ORDER BY rank, event_journal.id DESC
+                LIMIT :limit OFFSET :offset
+                """
+            ),
+            {"user_id": user_id, "phrase": phrase, "limit": limit, "offset": offset},
+        ).all()
+
+    @staticmethod
+    def _search_like(user_id, query, limit, offset):
+        """短查詢或其他資料庫：在使用者自己的事件中以 LIKE 比對，標題符合的排前面"""
+        pattern = f"%{_escape_like(query)}%"
+        title_match = EventJournal.event_title.like(pattern, escape="\\")
+        return db.session.query(EventJournal.id).filter(
+            EventJournal.user_id == user_id,
+            or_(title_match, EventJournal.event_content.like(pattern, escape="\\")),
+        ).order_by(
+            case((title_match, 0), else_=1), EventJournal.event_date.desc(), EventJournal.id.desc()
+        ).limit(limit).offset(offset).all()
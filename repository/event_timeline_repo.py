@@ -0,0 +1,94 @@
+import logging
+from collections import Counter
+from datetime import date, datetime, timezone
+
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+from models.event_timeline import EventTimeline
+
+UPSERT_INSERTS = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
+
+
+def month_of(event_date):
+    """
+    事件日期所屬的 (year, month)，一律以 UTC 計算；無法解析時回傳 None。
+
+    必須傳入從資料庫讀回的值（SQLite 讀回的時間不含時區，視為 UTC），
+    新增、移除才會把同一個事件算在同一個月份。
+    migrations/v008 重新計算既有資料時使用相同的規則，修改時兩邊要一致。
+    """
+    if isinstance(event_date, str):
+        try:
+            event_date = datetime.fromisoformat(event_date)
+        except ValueError:
+            return None
+    if isinstance(event_date, datetime) and event_date.tzinfo is not None:
+        event_date = event_date.astimezone(timezone.utc)
+    if isinstance(event_date, (datetime, date)):
+        return event_date.year, event_date.month
+    return None
+
+
+class EventTimelineRepository:
+    @staticmethod
+    def adjust(user_id, deltas):
+        """
+        增減使用者各月份的事件數量。不會 commit，由呼叫端和事件的異動一起 commit。
+
+        Parameters:
+        - deltas (Counter): {(year, month): 增減數量}。
+        """
+        deltas = {month: delta for month, delta in deltas.items() if month and delta}
+        if not deltas:
+            return
+        insert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+        for (year, month), delta in deltas.items():
+            if insert is not None:
+                # 以單一條 upsert 更新，同時新增的事件不會互相覆蓋
+                statement = insert(EventTimeline).values(
+                    user_id=user_id, year=year, month=month, event_count=delta
+                )
+                db.session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["user_id", "year", "month"],
+                        set_={"event_count": EventTimeline.event_count + delta},
+                    )
+                )
+                continue
+            row = EventTimeline.query.filter_by(user_id=user_id, year=year, month=month).with_for_update().first()
+            if row is None:
+                db.session.add(EventTimeline(user_id, year, month, delta))
+            else:
+                row.event_count += delta
+        db.session.flush()
+        EventTimeline.query.filter(
+            EventTimeline.user_id == user_id, EventTimeline.event_count <= 0
+        ).delete(synchronize_session=False)
+
+    @staticmethod
+    def record(user_id, added=(), removed=()):
+        """
+        依新增與移除的事件日期更新數量（修改日期的事件兩邊都要傳入）。
+
+        日期必須是從資料庫讀回的值（新增、修改要先 flush 再讀回），不可以使用請求中的原始字串。
+        """
+        deltas = Counter()
+        for event_date in added:
+            deltas[month_of(event_date)] += 1
+        for event_date in removed:
+            deltas[month_of(event_date)] -= 1
+        EventTimelineRepository.adjust(user_id, deltas)
+
+    @staticmethod
+    def get_timeline(user_id):
+        """依年份、月份排序取得使用者的事件數量"""
+        try:
+            return EventTimeline.query.filter_by(user_id=user_id).order_by(
+                EventTimeline.year.asc(), EventTimeline.month.asc()
+            ).all()
+        except SQLAlchemyError as e:
+            logging.error(f"Error retrieving timeline for user ID {user_id}: {e}")
+            raise e
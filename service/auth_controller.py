@@ -16,13 +16,12 @@ import utils.mail_sender as mail_sender
 from repository.password_verification_repo import PasswordVerificationCodeRepo
 import pyotp
 from repository.userphoto_repo import UserPhotoRepo
+from utils.current_user import current_user, current_user_id, forget_user, identity_claims
+from utils.serializers import avatar_url
 
 auth_bp = Blueprint("auth", __name__)
 logger = logging.getLogger(__name__)
 
-# BASE_URL = "http://192.168.1.109:8080" # 安的IP
-BASE_URL = "https://nccu-group-8.work"   # 主機IP
-
 @auth_bp.post("/register")
 @swag_from({
     'tags': ['Authentication'],
@@ -299,20 +298,17 @@ def login():
         if user_info:
             photo_name =user_info.photoname
         
-        if photo_name == "avatar.png":
-            photo_path = f"{BASE_URL}/userinfo/images/default/{photo_name}"
-        else:
-            photo_path = f"{BASE_URL}/userinfo/images/{user.id}/{photo_name}"
+        photo_path = avatar_url(user.id, photo_name)
 
         # 刪除之前的 refresh token
         RefreshToken.delete_revoked_tokens(user.id)
 
-        # 成功登入時生成 token
+        # 成功登入時生成 token，token 中帶有使用者 ID，之後的請求不需要再查詢使用者
         access_token = create_access_token(
-            identity=email, expires_delta=timedelta(minutes=30)
+            identity=email, additional_claims=identity_claims(user.id), expires_delta=timedelta(minutes=30)
         )
         refresh_token = create_refresh_token(
-            identity=email, expires_delta=timedelta(days=7)
+            identity=email, additional_claims=identity_claims(user.id), expires_delta=timedelta(days=7)
         )
 
         # 保存新的 refresh token 到數據庫
@@ -427,7 +423,9 @@ def refresh():
     try:
         # 從 JWT 中獲取當前使用者身份 (email)
         current_email = get_jwt_identity()
-        user = User.get_user_by_email(current_email)
+        user_id = current_user_id()
+        if user_id is None:
+            return jsonify(message="使用者不存在"), 404
 
         # 檢查 Authorization header 並提取 refresh token
         auth_header = request.headers.get("Authorization", None)
@@ -437,13 +435,15 @@ def refresh():
         refresh_token = auth_header.split(" ")[1]
 
         # 從資料庫中查找這個 Refresh Token
-        stored_token = RefreshToken.find_by_token_and_user(refresh_token, user.id)
+        stored_token = RefreshToken.find_by_token_and_user(refresh_token, user_id)
 
         if not stored_token or stored_token.revoked:
             return jsonify(message="Refresh Token 已失效或已撤銷"), 401
 
         # 為當前使用者生成新的 Access Token
-        new_access_token = create_access_token(identity=current_email)
+        new_access_token = create_access_token(
+            identity=current_email, additional_claims=identity_claims(user_id)
+        )
 
         # 返回新的 Access Token
         return jsonify(access_token=new_access_token), 200
@@ -520,11 +520,12 @@ def refresh():
 def logout():
     try:
         # 獲取當前用戶的身份
-        current_email = get_jwt_identity()
-        user = User.get_user_by_email(current_email)
+        user_id = current_user_id()
+        if user_id is None:
+            return jsonify(message="使用者不存在"), 404
 
         # 從資料庫查找對應的 Refresh Token
-        stored_token = RefreshToken.find_by_userId(user.id)
+        stored_token = RefreshToken.find_by_userId(user_id)
 
         if stored_token and not stored_token.revoked:
             stored_token.revoke()
@@ -614,11 +615,12 @@ def delete():
     current_email = get_jwt_identity()
 
     try:
-        user_to_delete = User.get_user_by_email(current_email)
+        user_to_delete = current_user()
         if user_to_delete:
             try:
                 # 刪除用戶並提交變更
                 User.delete(user_to_delete)
+                forget_user(user_to_delete)
                 logger.info(f"用戶 {current_email} 帳號刪除成功")
                 return jsonify(message="帳號刪除成功"), 200
             except Exception as e:
@@ -1,17 +1,173 @@
+import base64
+import csv
+import io
+import json
 import logging
 from flasgger import swag_from
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models.user import User
-from datetime import datetime, timezone
+from flask import Blueprint, Response, request, jsonify
+from flask_jwt_extended import jwt_required
+from utils.current_user import current_user_id
+from models.event_journal import EventJournal
+from datetime import MAXYEAR, MINYEAR, datetime, timezone
 from repository.event_journal_repo import EventJournalRepository
-from utils import chroma
+from repository.event_journal_version_repo import EventJournalVersionRepository
+from repository.event_search_repo import EventSearchRepository
+from repository.event_timeline_repo import EventTimelineRepository
+from utils.http_cache import is_not_modified, make_etag, not_modified_response, set_validators
+from utils.index_queue import index_queue
+from utils.serializers import dumps_line, event_serializer, serialize_event
 
 event_bp = Blueprint("event", __name__)
 logger = logging.getLogger(__name__)
 
-# BASE_URL = "http://192.168.1.109:8080" # 安的IP
-BASE_URL = "https://nccu-group-8.work"   # 主機IP
+# 批次操作一次最多處理的筆數
+BULK_MAX_ROWS = 5000
+# 事件列表每頁的預設筆數與上限
+EVENTS_PAGE_SIZE = 50
+EVENTS_MAX_PAGE_SIZE = 200
+# 搜尋結果最多可以翻到第幾筆
+SEARCH_MAX_OFFSET = 1000
+# 有長度限制的事件欄位 -> 最大長度（和資料表定義一致）
+EVENT_FIELD_LENGTHS = {
+    name: EventJournal.__table__.c[name].type.length for name in ("event_title", "event_picture")
+}
+# 事件回應中可選擇的欄位 -> 需要從資料庫載入的欄位
+EVENT_FIELDS = {field: attribute for field, (attribute, _) in event_serializer.fields.items()}
+
+
+def index_event(event):
+    """通知向量資料庫的寫入佇列同步事件（背景從資料庫讀取最新的內容）"""
+    index_queue.enqueue(user_id=event.user_id, event_id=event.id)
+
+
+def parse_bulk_rows():
+    """
+    從請求中讀取批次操作的資料列，支援 JSON 與 CSV。
+
+    - JSON：陣列，或是包含 'events' 陣列的物件。
+    - CSV：multipart 的 'file' 欄位，或 Content-Type 為 text/csv 的 body，第一列為欄位名稱。
+
+    Raises:
+    - ValueError: 格式錯誤或筆數超過上限。
+    """
+    if "file" in request.files:
+        text = request.files["file"].read().decode("utf-8-sig")
+        rows = list(csv.DictReader(io.StringIO(text)))
+    elif request.mimetype == "text/csv":
+        rows = list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+    else:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get("events")
+        if not isinstance(data, list):
+            raise ValueError("請提供 JSON 陣列或 CSV 檔案")
+        rows = data
+
+    if len(rows) > BULK_MAX_ROWS:
+        raise ValueError(f"一次最多處理 {BULK_MAX_ROWS} 筆")
+    return rows
+
+
+def clean_event_fields(row, required):
+    """
+    檢查批次資料中一列的事件欄位，回傳 (要寫入的欄位, 錯誤訊息)。
+
+    寫入前逐列檢查型別、長度與日期，一列不合法只會回報該列的錯誤，不會讓整批交易失敗。
+    required 為 True（匯入）時標題、內容、日期都必須提供；否則只檢查有提供的欄位（更新）。
+    """
+    fields = {}
+    for field in ("event_title", "event_content", "event_picture"):
+        value = row.get(field)
+        if value is None or value == "":
+            continue
+        if not isinstance(value, str):
+            return None, f"{field} 必須是字串"
+        max_length = EVENT_FIELD_LENGTHS.get(field)
+        if max_length is not None and len(value) > max_length:
+            return None, f"{field} 不能超過 {max_length} 個字"
+        fields[field] = value
+    if required and (not fields.get("event_title") or not fields.get("event_content")):
+        return None, "標題和內容不能為空"
+
+    event_date = row.get("event_date")
+    if event_date or required:
+        try:
+            fields["event_date"] = datetime.fromisoformat(str(event_date))
+        except ValueError:
+            return None, "日期格式錯誤"
+    return fields, None
+
+
+def ndjson_results(results):
+    """
+    以 NDJSON（每行一筆）回傳批次操作的結果。
+
+    整批在同一個交易中寫入，commit 之後才會輸出，不是邊處理邊回傳；
+    以 generator 輸出只是為了不必先組成整個回應字串。
+    """
+    return Response(
+        (dumps_line(result) for result in results),
+        mimetype="application/x-ndjson",
+    )
+
+
+def encode_cursor(event):
+    """把分頁最後一筆事件的 (event_date, id) 編成不透明的游標字串"""
+    payload = json.dumps([event.event_date.isoformat(), event.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    解析 encode_cursor 產生的游標。
+
+    Raises:
+    - ValueError: 游標格式錯誤。
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        event_date, event_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(event_date), int(event_id)
+    except Exception:
+        raise ValueError("無效的分頁游標")
+
+
+def parse_fields(value):
+    """
+    解析 fields 參數（以逗號分隔），None 表示回傳所有欄位。
+
+    Raises:
+    - ValueError: 包含不支援的欄位。
+    """
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in EVENT_FIELDS]
+    if unknown:
+        raise ValueError(f"不支援的欄位：{', '.join(unknown)}")
+    return fields
+
+
+def parse_date_param(value):
+    """
+    解析 from/to 查詢參數，接受 YYYY-MM-DD 或 ISO 8601 日期時間。
+
+    Raises:
+    - ValueError: 日期格式錯誤。
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"無效的日期：{value}")
+
+
+def parse_event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
 
 @event_bp.post("/create_event")
@@ -127,11 +283,8 @@ BASE_URL = "https://nccu-group-8.work"   # 主機IP
     }
 )
 def create_event():
-    current_email = get_jwt_identity()
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
     # 緩存請求的 JSON 數據
@@ -148,29 +301,19 @@ def create_event():
 
     try:
         # 創建新的事件
-        event = EventJournalRepository.create_event(user.id, event_title, event_content, event_date, event_picture)
-
-        # 新增到向量資料庫
-        collection_name = f"collection_{user.id}"
-        collection = chroma.create_collection(collection_name)
-        metadata = {"user_id": user.id, "event_title": event_title, "event_date": event_date}
-        chroma.add_document(
-            collection=collection,
-            document=f"{event_date}:{event_title}是{event_content}",
-            id=str(event.id),
-            metadata=metadata,
-        )
+        event = EventJournalRepository.create_event(user_id, event_title, event_content, event_date, event_picture)
+
+        # 新增到向量資料庫（背景寫入）
+        index_event(event)
 
         return (
             jsonify(
-                {
-                    "msg": "事件創建成功",
-                    "event_id": event.id,
-                    "created_at": event.created_at.isoformat(),
-                    "updated_at": event.updated_at.isoformat(),
-                    "event_date": event.event_date.isoformat(),
-                    "event_picture": f'{BASE_URL}/userinfo/images/default/{event.event_picture}'
-                }
+                serialize_event(
+                    event,
+                    ["event_id", "created_at", "updated_at", "event_date", "event_picture"],
+                    msg="事件創建成功",
+                    index_status=index_queue.get_status(event.id),
+                )
             ),
             201,
         )
@@ -186,13 +329,15 @@ def create_event():
     {
         "tags": ["EventJournal"],
         "description": """
-    此 API 用於查詢特定使用者的所有事件列表。
+    此 API 用於分頁查詢特定使用者的事件列表，依事件日期由舊到新排序。
+    沒有提供 limit 和 cursor 時不分頁，返回全部事件（相容尚未支援分頁的前端）。
+    提供 from/to 時只查詢事件日期在 [from, to) 之間的事件（例如月曆顯示一個月）。
 
     Steps:
     1. 驗證使用者身份。
     2. 確認所查詢的使用者 ID 是否存在。
-    3. 從資料庫查詢與該使用者 ID 關聯的所有事件。
-    4. 返回事件列表，包括事件的標題、內容和創建時間。
+    3. 從資料庫以 (event_date, id) 游標查詢下一頁事件，只載入 fields 指定的欄位。
+    4. 返回事件列表；還有下一頁時，游標放在 X-Next-Cursor 回應標頭。
 
     Returns:
     - JSON 回應訊息：
@@ -200,6 +345,43 @@ def create_event():
       - 失敗時：返回錯誤消息及相應的 HTTP 狀態碼。
     """,
         "parameters": [
+            {
+                "name": "limit",
+                "in": "query",
+                "required": False,
+                "type": "integer",
+                "description": f"每頁筆數，只提供 cursor 時預設 {EVENTS_PAGE_SIZE}，最多 {EVENTS_MAX_PAGE_SIZE}",
+            },
+            {
+                "name": "cursor",
+                "in": "query",
+                "required": False,
+                "type": "string",
+                "description": "上一頁回應的 X-Next-Cursor 標頭",
+            },
+            {
+                "name": "fields",
+                "in": "query",
+                "required": False,
+                "type": "string",
+                "description": "以逗號分隔要回傳的欄位，例如 event_id,event_title,event_date",
+            },
+            {
+                "name": "from",
+                "in": "query",
+                "required": False,
+                "type": "string",
+                "description": "事件日期下限（包含），YYYY-MM-DD 或 ISO 8601",
+                "example": "2024-10-01",
+            },
+            {
+                "name": "to",
+                "in": "query",
+                "required": False,
+                "type": "string",
+                "description": "事件日期上限（不包含），YYYY-MM-DD 或 ISO 8601",
+                "example": "2024-11-01",
+            },
             {
                 "name": "Authorization",
                 "in": "header",
@@ -209,8 +391,12 @@ def create_event():
             },
         ],
         "responses": {
+            304: {"description": "內容沒有變動（符合 If-None-Match 或 If-Modified-Since）"},
             200: {
                 "description": "事件列表成功返回",
+                "headers": {
+                    "X-Next-Cursor": {"type": "string", "description": "下一頁的游標，沒有下一頁時不會出現"}
+                },
                 "schema": {
                     "type": "array",
                     "items": {
@@ -236,6 +422,7 @@ def create_event():
                     },
                 },
             },
+            400: {"description": "limit、cursor、fields 或 from/to 格式錯誤"},
             404: {
                 "description": "使用者不存在或未找到事件",
                 "schema": {
@@ -258,42 +445,52 @@ def create_event():
     }
 )
 def get_events():
-    current_email = get_jwt_identity()
-
-    user_id = User.get_user_by_email(current_email).id
-    # 確認使用者是否存在
-    user_exists = User.is_user_id_exists(user_id)
-    if not user_exists:
-        return jsonify({"error": "User ID not found"}), 404
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
     try:
-        # 查詢與該使用者 ID 關聯的所有事件
-        events = EventJournalRepository.get_events_by_user_id(user.id)
+        cursor = request.args.get("cursor")
+        after = decode_cursor(cursor) if cursor else None
+        limit = None
+        if "limit" in request.args or cursor:
+            limit = min(request.args.get("limit", EVENTS_PAGE_SIZE, type=int), EVENTS_MAX_PAGE_SIZE)
+            if limit <= 0:
+                raise ValueError("limit 必須大於 0")
+        fields = parse_fields(request.args.get("fields"))
+        start = parse_date_param(request.args.get("from"))
+        end = parse_date_param(request.args.get("to"))
+        if start is not None and end is not None and start >= end:
+            raise ValueError("from 必須早於 to")
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
 
-        # 檢查是否有事件
-        if not events:
+    try:
+        # 先以主鍵讀取使用者的最後異動時間，內容沒變就不用查詢和序列化事件
+        last_modified = EventJournalVersionRepository.get_changed_at(user_id)
+        etag = make_etag("events", user_id, last_modified)
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+        # 只查詢這一頁的事件，而且只載入需要的欄位
+        events, has_more = EventJournalRepository.get_events_page(
+            user_id,
+            limit,
+            after=after,
+            columns=[EVENT_FIELDS[field] for field in fields] if fields else None,
+            start=start,
+            end=end,
+        )
+
+        # 第一頁就沒有事件
+        if not events and after is None:
             return jsonify(message="沒有事件存在"), 404
 
         # 構建事件列表的回應
-        event_list = [
-            {
-                "event_id": event.id,
-                "event_title": event.event_title,
-                "event_content": event.event_content,
-                "created_at": event.created_at.isoformat(),
-                "updated_at": event.updated_at.isoformat(),
-                "event_date": event.event_date.isoformat(),
-                "event_picture": f'{BASE_URL}/userinfo/images/default/{event.event_picture}'
-            }
-            for event in events
-        ]
-
-        return jsonify(event_list), 200
+        response = jsonify(event_serializer.many(events, fields))
+        if has_more:
+            response.headers["X-Next-Cursor"] = encode_cursor(events[-1])
+        return set_validators(response, etag, last_modified), 200
 
     except Exception as e:
         return jsonify(message="查詢事件時發生錯誤", error=str(e)), 500
@@ -336,6 +533,7 @@ def get_events():
             },
         ],
         "responses": {
+            304: {"description": "內容沒有變動（符合 If-None-Match 或 If-Modified-Since）"},
             200: {
                 "description": "事件成功返回",
                 "schema": {
@@ -386,11 +584,8 @@ def get_events():
     }
 )
 def get_event(event_id):
-    current_email = get_jwt_identity()
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
     try:
@@ -402,21 +597,18 @@ def get_event(event_id):
             return jsonify(message="事件不存在"), 404
 
         # 檢查該事件是否屬於當前使用者
-        if event.user_id != user.id:
+        if event.user_id != user_id:
             return jsonify(message="事件不屬於當前用戶"), 403
 
+        index_status = index_queue.get_status(event.id)
+        etag = make_etag("event", event.id, event.updated_at, index_status)
+        if is_not_modified(etag, event.updated_at):
+            return not_modified_response(etag, event.updated_at)
+
         # 構建事件的回應
-        event_response = {
-            "event_id": event.id,
-            "event_title": event.event_title,
-            "event_content": event.event_content,
-            "created_at": event.created_at.isoformat(),
-            "updated_at": event.updated_at.isoformat(),
-            "event_date": event.event_date.isoformat(),
-            "event_picture": f'{BASE_URL}/userinfo/images/default/{event.event_picture}'
-        }
-
-        return jsonify(event_response), 200
+        event_response = serialize_event(event, index_status=index_status)
+
+        return set_validators(jsonify(event_response), etag, event.updated_at), 200
 
     except Exception as e:
         return jsonify(message="查詢事件時發生錯誤", error=str(e)), 500
@@ -527,11 +719,8 @@ def get_event(event_id):
     }
 )
 def update_event(event_id):
-    current_email = get_jwt_identity()
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
     # 查詢事件是否存在並屬於當前使用者
@@ -541,7 +730,7 @@ def update_event(event_id):
         return jsonify(message="事件不存在"), 404
 
     # 檢查該事件是否屬於當前使用者
-    if event.user_id != user.id:
+    if event.user_id != user_id:
         return jsonify(message="事件不屬於當前用戶"), 403
 
     # 獲取請求中的更新內容
@@ -558,25 +747,12 @@ def update_event(event_id):
         updated_event = EventJournalRepository.update_event(
             event.id, event_title, event_content, updated_at, event_date, event_picture
         )
-        collection_name = f"collection_{user.id}"
-        collection = chroma.create_collection(collection_name)
-        metadata = {"user_id": user.id, "event_title": event_title}
-        chroma.update_document(
-            collection=collection,
-            id=str(event.id),
-            document=f"{event_date}:{event_title}是{event_content}",
-            metadata=metadata,
-        )
+        # 以更新後的內容重建文件，內容沒變時不會重新 embedding
+        index_event(updated_event)
         # 構建回應
-        updated_event_response = {
-            "event_id": updated_event.id,
-            "event_title": updated_event.event_title,
-            "event_content": updated_event.event_content,
-            "created_at": updated_event.created_at.isoformat(),
-            "updated_at": updated_event.updated_at.isoformat(),
-            "event_date": event.event_date.isoformat(),
-            "event_picture": f'{BASE_URL}/userinfo/images/default/{event.event_picture}'
-        }
+        updated_event_response = serialize_event(
+            updated_event, index_status=index_queue.get_status(updated_event.id)
+        )
 
         return jsonify(updated_event_response), 200
 
@@ -652,11 +828,8 @@ def update_event(event_id):
     }
 )
 def delete_event(event_id):
-    current_email = get_jwt_identity()
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
     # 查詢事件是否存在並屬於當前使用者
@@ -665,16 +838,14 @@ def delete_event(event_id):
         return jsonify(message="事件不存在"), 404
 
     # 檢查該事件是否屬於當前使用者
-    if event.user_id != user.id:
+    if event.user_id != user_id:
         return jsonify(message="事件不屬於當前用戶"), 403
 
     try:
         # 從資料庫中刪除事件
         EventJournalRepository.delete_event(event_id)
 
-        collection_name = f"collection_{user.id}"
-        collection = chroma.create_collection(collection_name)
-        chroma.delete_document(collection=collection, id=str(event.id))
+        index_queue.enqueue(user_id=user_id, event_id=event.id)
         # 返回成功的回應
         return jsonify(message="事件已成功刪除"), 204
 
@@ -718,6 +889,7 @@ def delete_event(event_id):
             },
         ],
         "responses": {
+            304: {"description": "內容沒有變動（符合 If-None-Match 或 If-Modified-Since）"},
             200: {
                 "description": "事件列表成功返回",
                 "schema": {
@@ -745,6 +917,15 @@ def delete_event(event_id):
                     },
                 },
             },
+            400: {
+                "description": "年份格式錯誤或超出範圍",
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "message": {"type": "string", "example": "請提供有效的年份格式"}
+                    },
+                },
+            },
             404: {
                 "description": "使用者不存在或未找到事件",
                 "schema": {
@@ -767,11 +948,9 @@ def delete_event(event_id):
     }
 )
 def get_events_by_year(target_year):
-    current_email = get_jwt_identity()
-
-    # 只查詢一次使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    # 使用者 ID 來自 token，不需要查詢 user 表
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
     try:
@@ -780,29 +959,496 @@ def get_events_by_year(target_year):
             target_year = int(target_year)
         except ValueError:
             return jsonify(message="請提供有效的年份格式"), 400
+        # 查詢區間的結束是下一年的 1 月 1 日，年份必須在 datetime 可表示的範圍內
+        if not MINYEAR <= target_year < MAXYEAR:
+            return jsonify(message=f"年份必須介於 {MINYEAR} 到 {MAXYEAR - 1} 之間"), 400
+
+        # 先以主鍵讀取使用者的最後異動時間，內容沒變就不用查詢和序列化事件
+        start, end = EventJournalRepository.date_range_of(target_year)
+        last_modified = EventJournalVersionRepository.get_changed_at(user_id)
+        etag = make_etag("events", user_id, target_year, last_modified)
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified)
 
-        # 查詢與該使用者 ID 關聯的所有事件
-        events = EventJournalRepository.get_events_by_date(user.id, target_year)
+        # 查詢該年份的事件
+        events = EventJournalRepository.get_events_by_date_range(user_id, start, end)
 
         # 檢查是否有事件
         if not events:
             return jsonify(message="沒有事件存在"), 404
 
         # 構建事件列表的回應
-        event_list = [
-            {
-                "event_id": event.id,
-                "event_title": event.event_title,
-                "event_content": event.event_content,
-                "created_at": event.created_at.isoformat(),
-                "updated_at": event.updated_at.isoformat(),
-                "event_date": event.event_date.isoformat(),
-                "event_picture": f'{BASE_URL}/userinfo/images/default/{event.event_picture}'
-            }
-            for event in events
-        ]
-
-        return jsonify(event_list), 200
+        event_list = event_serializer.many(events)
+
+        return set_validators(jsonify(event_list), etag, last_modified), 200
 
     except Exception as e:
         return jsonify(message="查詢事件時發生錯誤", error=str(e)), 500
+
+
+@event_bp.get("/timeline")
+@jwt_required()
+@swag_from(
+    {
+        "tags": ["EventJournal"],
+        "description": """
+    此 API 用於取得使用者每年、每月的事件數量，供時間軸瀏覽使用。
+
+    Steps:
+    1. 驗證使用者身份。
+    2. 讀取預先計算好的每月事件數量（事件新增、修改、刪除時同步更新，既有資料由 migration 計算）。
+    3. 依年份、月份由舊到新返回數量。
+
+    Returns:
+    - JSON 回應訊息：
+      - 成功時：返回事件總數及每年、每月的事件數量。
+      - 失敗時：返回錯誤消息及相應的 HTTP 狀態碼。
+    """,
+        "parameters": [
+            {
+                "name": "Authorization",
+                "in": "header",
+                "required": True,
+                "description": "Bearer token for authorization",
+                "schema": {"type": "string", "example": "Bearer "},
+            },
+        ],
+        "responses": {
+            304: {"description": "內容沒有變動（符合 If-None-Match）"},
+            200: {
+                "description": "時間軸成功返回",
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "total": {"type": "integer", "example": 12},
+                        "years": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "year": {"type": "integer", "example": 2024},
+                                    "count": {"type": "integer", "example": 12},
+                                    "months": {
+                                        "type": "array",
+                                        "items": {
+                                            "type": "object",
+                                            "properties": {
+                                                "month": {"type": "integer", "example": 10},
+                                                "count": {"type": "integer", "example": 3},
+                                            },
+                                        },
+                                    },
+                                },
+                            },
+                        },
+                    },
+                },
+            },
+            404: {"description": "使用者不存在"},
+            500: {"description": "伺服器內部錯誤"},
+        },
+    }
+)
+def get_timeline():
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify(message="使用者不存在"), 404
+
+    try:
+        rows = EventTimelineRepository.get_timeline(user_id)
+        total = sum(row.event_count for row in rows)
+
+        counts = [(row.year, row.month, row.event_count) for row in rows]
+        etag = make_etag("timeline", user_id, counts)
+        if is_not_modified(etag):
+            return not_modified_response(etag)
+
+        years = []
+        for year, month, event_count in counts:
+            if not years or years[-1]["year"] != year:
+                years.append({"year": year, "count": 0, "months": []})
+            years[-1]["count"] += event_count
+            years[-1]["months"].append({"month": month, "count": event_count})
+
+        return set_validators(jsonify(total=total, years=years), etag), 200
+
+    except Exception as e:
+        return jsonify(message="查詢時間軸時發生錯誤", error=str(e)), 500
+
+
+@event_bp.get("/search")
+@jwt_required()
+@swag_from(
+    {
+        "tags": ["EventJournal"],
+        "description": """
+    此 API 用於以關鍵字搜尋使用者的事件標題與內容。
+
+    Steps:
+    1. 驗證使用者身份。
+    2. 以全文檢索索引搜尋（PostgreSQL：pg_trgm / tsvector；SQLite：FTS5 trigram），
+       查詢少於 3 個字時改以 LIKE 比對。
+    3. 依相關程度排序（標題符合的權重較高），分頁返回事件；
+       還有下一頁時，下一頁的 offset 放在 X-Next-Offset 回應標頭。
+
+    Returns:
+    - JSON 回應訊息：
+      - 成功時：返回符合的事件列表（可能為空）。
+      - 失敗時：返回錯誤消息及相應的 HTTP 狀態碼。
+    """,
+        "parameters": [
+            {
+                "name": "q",
+                "in": "query",
+                "required": True,
+                "type": "string",
+                "description": "搜尋關鍵字",
+                "example": "生日",
+            },
+            {
+                "name": "limit",
+                "in": "query",
+                "required": False,
+                "type": "integer",
+                "description": f"每頁筆數，預設 {EVENTS_PAGE_SIZE}，最多 {EVENTS_MAX_PAGE_SIZE}",
+            },
+            {
+                "name": "offset",
+                "in": "query",
+                "required": False,
+                "type": "integer",
+                "description": f"略過的筆數（上一頁回應的 X-Next-Offset），最多 {SEARCH_MAX_OFFSET}",
+            },
+            {
+                "name": "fields",
+                "in": "query",
+                "required": False,
+                "type": "string",
+                "description": "以逗號分隔要回傳的欄位，例如 event_id,event_title,event_date",
+            },
+            {
+                "name": "Authorization",
+                "in": "header",
+                "required": True,
+                "description": "Bearer token for authorization",
+                "schema": {"type": "string", "example": "Bearer "},
+            },
+        ],
+        "responses": {
+            200: {
+                "description": "搜尋結果成功返回",
+                "headers": {
+                    "X-Next-Offset": {"type": "integer", "description": "下一頁的 offset，沒有下一頁時不會出現"}
+                },
+            },
+            400: {"description": "缺少關鍵字或參數格式錯誤"},
+            404: {"description": "使用者不存在"},
+            500: {"description": "伺服器內部錯誤"},
+        },
+    }
+)
+def search_events():
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify(message="使用者不存在"), 404
+
+    try:
+        query = (request.args.get("q") or "").strip()
+        if not query:
+            raise ValueError("請提供搜尋關鍵字")
+        limit = min(request.args.get("limit", EVENTS_PAGE_SIZE, type=int), EVENTS_MAX_PAGE_SIZE)
+        offset = request.args.get("offset", 0, type=int)
+        if limit <= 0 or not 0 <= offset <= SEARCH_MAX_OFFSET:
+            raise ValueError("limit 或 offset 超出範圍")
+        fields = parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+
+    try:
+        event_ids, has_more = EventSearchRepository.search(user_id, query, limit, offset)
+        events = EventJournalRepository.get_events_by_ids(
+            user_id,
+            event_ids,
+            columns=[EVENT_FIELDS[field] for field in fields] if fields else None,
+        )
+
+        response = jsonify(event_serializer.many(events, fields))
+        if has_more and offset + limit <= SEARCH_MAX_OFFSET:
+            response.headers["X-Next-Offset"] = str(offset + limit)
+        return response, 200
+
+    except Exception as e:
+        return jsonify(message="搜尋事件時發生錯誤", error=str(e)), 500
+
+
+@event_bp.post("/bulk_import")
+@jwt_required()
+@swag_from(
+    {
+        "tags": ["EventJournal"],
+        "description": """
+    此 API 用於批次匯入事件（例如從日記搬移資料）。
+
+    Input:
+    - JSON 陣列（或包含 'events' 陣列的物件），每筆包含 'event_title'、'event_content'、'event_date'、'event_picture'。
+    - 或是 CSV 檔案（multipart 'file' 欄位，或 Content-Type 為 text/csv），第一列為上述欄位名稱。
+
+    Steps:
+    1. 驗證使用者身份。
+    2. 逐列驗證標題、內容和日期。
+    3. 在同一個交易中新增所有通過驗證的事件。
+    4. 將事件批次排入向量資料庫的寫入佇列。
+    5. 交易完成後以 NDJSON 回傳每一筆的結果（每行一筆）。
+
+    Returns:
+    - NDJSON 回應，每列包含 'row'、'status'（created 或 error），成功時有 'event_id'，失敗時有 'msg'。
+    """,
+        "consumes": ["application/json", "multipart/form-data", "text/csv"],
+        "produces": ["application/x-ndjson"],
+        "parameters": [
+            {
+                "name": "Authorization",
+                "in": "header",
+                "required": True,
+                "description": "Bearer token for authorization",
+                "schema": {"type": "string", "example": "Bearer "},
+            },
+            {
+                "name": "body",
+                "in": "body",
+                "required": False,
+                "schema": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "event_title": {"type": "string", "example": "生日派對"},
+                            "event_content": {"type": "string", "example": "在家舉辦一個生日派對"},
+                            "event_date": {"type": "string", "example": "2023-12-25"},
+                            "event_picture": {"type": "string", "example": "event_picture1.jpg"},
+                        },
+                    },
+                },
+            },
+        ],
+        "responses": {
+            200: {"description": "每一筆的匯入結果 (NDJSON，每行一筆)"},
+            400: {"description": "格式錯誤或筆數超過上限"},
+            404: {"description": "使用者不存在"},
+            500: {"description": "伺服器內部錯誤"},
+        },
+    }
+)
+def bulk_import_events():
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify(message="使用者不存在"), 404
+
+    try:
+        rows = parse_bulk_rows()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify(msg=str(e)), 400
+
+    results = [None] * len(rows)
+    valid_rows = []
+    valid_indexes = []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            results[i] = {"row": i, "status": "error", "msg": "標題和內容不能為空"}
+            continue
+        fields, error = clean_event_fields(row, required=True)
+        if error:
+            results[i] = {"row": i, "status": "error", "msg": error}
+            continue
+        fields.setdefault("event_picture", "")
+        valid_rows.append(fields)
+        valid_indexes.append(i)
+
+    try:
+        events = EventJournalRepository.bulk_create_events(user_id, valid_rows)
+    except Exception as e:
+        return jsonify({"msg": "匯入事件時發生錯誤", "error": str(e)}), 500
+
+    for i, event in zip(valid_indexes, events):
+        index_event(event)
+        results[i] = {"row": i, "status": "created", "event_id": event.id}
+
+    return ndjson_results(results)
+
+
+@event_bp.put("/bulk_update")
+@jwt_required()
+@swag_from(
+    {
+        "tags": ["EventJournal"],
+        "description": """
+    此 API 用於批次更新事件。
+
+    Input:
+    - JSON 陣列或 CSV，每筆必須包含 'event_id'，其餘欄位（'event_title'、'event_content'、'event_date'、'event_picture'）有填才會更新。
+
+    Steps:
+    1. 驗證使用者身份。
+    2. 在同一個交易中更新所有屬於當前使用者的事件。
+    3. 將更新後的事件批次排入向量資料庫的寫入佇列。
+    4. 交易完成後以 NDJSON 回傳每一筆的結果（每行一筆）。
+
+    Returns:
+    - NDJSON 回應，每列包含 'row'、'status'（updated 或 error）與 'event_id'。
+    """,
+        "consumes": ["application/json", "multipart/form-data", "text/csv"],
+        "produces": ["application/x-ndjson"],
+        "parameters": [
+            {
+                "name": "Authorization",
+                "in": "header",
+                "required": True,
+                "description": "Bearer token for authorization",
+                "schema": {"type": "string", "example": "Bearer "},
+            },
+            {
+                "name": "body",
+                "in": "body",
+                "required": False,
+                "schema": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "event_id": {"type": "integer", "example": 1},
+                            "event_title": {"type": "string", "example": "更新的生日派對"},
+                            "event_content": {"type": "string", "example": "這是一個更新的生日派對內容"},
+                        },
+                        "required": ["event_id"],
+                    },
+                },
+            },
+        ],
+        "responses": {
+            200: {"description": "每一筆的更新結果 (NDJSON，每行一筆)"},
+            400: {"description": "格式錯誤或筆數超過上限"},
+            404: {"description": "使用者不存在"},
+            500: {"description": "伺服器內部錯誤"},
+        },
+    }
+)
+def bulk_update_events():
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify(message="使用者不存在"), 404
+
+    try:
+        rows = parse_bulk_rows()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify(msg=str(e)), 400
+
+    results = [None] * len(rows)
+    valid_rows = []
+    valid_indexes = []
+    for i, row in enumerate(rows):
+        event_id = parse_event_id(row.get("event_id")) if isinstance(row, dict) else None
+        if event_id is None:
+            results[i] = {"row": i, "status": "error", "msg": "缺少有效的 event_id"}
+            continue
+        fields, error = clean_event_fields(row, required=False)
+        if error:
+            results[i] = {"row": i, "status": "error", "event_id": event_id, "msg": error}
+            continue
+        valid_rows.append({**fields, "event_id": event_id})
+        valid_indexes.append(i)
+
+    try:
+        events = EventJournalRepository.bulk_update_events(
+            user_id, valid_rows, updated_at=datetime.now(timezone.utc)
+        )
+    except Exception as e:
+        logging.error(f"批次更新事件時發生錯誤: {str(e)}")
+        return jsonify(message="更新事件時發生錯誤", error=str(e)), 500
+
+    for i, row in zip(valid_indexes, valid_rows):
+        event = events.get(row["event_id"])
+        if event is None:
+            results[i] = {"row": i, "status": "error", "event_id": row["event_id"], "msg": "事件不存在或不屬於當前用戶"}
+            continue
+        index_event(event)
+        results[i] = {"row": i, "status": "updated", "event_id": event.id}
+
+    return ndjson_results(results)
+
+
+@event_bp.delete("/bulk_delete")
+@jwt_required()
+@swag_from(
+    {
+        "tags": ["EventJournal"],
+        "description": """
+    此 API 用於批次刪除事件。
+
+    Input:
+    - JSON 陣列（事件 ID 或包含 'event_id' 的物件），或是含有 'event_id' 欄位的 CSV。
+
+    Steps:
+    1. 驗證使用者身份。
+    2. 在同一個交易中刪除所有屬於當前使用者的事件。
+    3. 將刪除批次排入向量資料庫的寫入佇列。
+    4. 交易完成後以 NDJSON 回傳每一筆的結果（每行一筆）。
+
+    Returns:
+    - NDJSON 回應，每列包含 'row'、'status'（deleted 或 error）與 'event_id'。
+    """,
+        "consumes": ["application/json", "multipart/form-data", "text/csv"],
+        "produces": ["application/x-ndjson"],
+        "parameters": [
+            {
+                "name": "Authorization",
+                "in": "header",
+                "required": True,
+                "description": "Bearer token for authorization",
+                "schema": {"type": "string", "example": "Bearer "},
+            },
+            {
+                "name": "body",
+                "in": "body",
+                "required": False,
+                "schema": {"type": "array", "items": {"type": "integer"}, "example": [1, 2, 3]},
+            },
+        ],
+        "responses": {
+            200: {"description": "每一筆的刪除結果 (NDJSON，每行一筆)"},
+            400: {"description": "格式錯誤或筆數超過上限"},
+            404: {"description": "使用者不存在"},
+            500: {"description": "伺服器內部錯誤"},
+        },
+    }
+)
+def bulk_delete_events():
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify(message="使用者不存在"), 404
+
+    try:
+        rows = parse_bulk_rows()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify(msg=str(e)), 400
+
+    event_ids = [
+        parse_event_id(row.get("event_id") if isinstance(row, dict) else row)
+        for row in rows
+    ]
+
+    try:
+        deleted_ids = EventJournalRepository.bulk_delete_events(
+            user_id, [event_id for event_id in event_ids if event_id is not None]
+        )
+    except Exception as e:
+        return jsonify(message="刪除事件時發生錯誤", error=str(e)), 500
+
+    results = []
+    for i, event_id in enumerate(event_ids):
+        if event_id in deleted_ids:
+            index_queue.enqueue(user_id=user_id, event_id=event_id)
+            results.append({"row": i, "status": "deleted", "event_id": event_id})
+        else:
+            results.append({"row": i, "status": "error", "event_id": event_id, "msg": "事件不存在或不屬於當前用戶"})
+
+    return ndjson_results(results)
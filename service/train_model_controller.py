@@ -1,19 +1,21 @@
+from functools import partial
 from typing import Optional
 from flask import Blueprint, current_app, request, jsonify
 from flasgger import swag_from
 import logging
 import json
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask_jwt_extended import jwt_required
 
 
 from models.trained_model import TrainedModel
-from models.user import User
+from utils.current_user import current_user_id
 from repository.shared_model_repo import SharedModelRepo
 from repository.trainedmodel_repo import TrainedModelRepo
 from repository.trainingfile_repo import TrainingFileRepo
 from service.utils_controller import FILE_DIRECTORY
 from train_model.finetune import BASE_MODEL_DIR, train
-from train_model.inference import inference
+from train_model.inference import generate_candidates
+from train_model.refine_stage import refinement_stage
 import os
 import threading
 
@@ -89,11 +91,8 @@ logger = logging.getLogger(__name__)
     }
 )
 def train_model():
-    current_email = get_jwt_identity()
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
     model_id = request.form.get("model_id")
@@ -102,13 +101,13 @@ def train_model():
 
     try:
         trained_model = TrainedModelRepo.find_trainedmodel_by_user_and_model_id(
-            user_id=user.id, model_id=model_id
+            user_id=user_id, model_id=model_id
         )
         if trained_model is None:
             return jsonify({"error": "Model not found"}), 404
 
         training_file = TrainingFileRepo.find_first_training_file_by_user_and_model_id(
-            user_id=user.id, model_id=model_id
+            user_id=user_id, model_id=model_id
         )
 
         if training_file is None:
@@ -120,13 +119,13 @@ def train_model():
             return jsonify({"status": "no file to train"}), 400
 
         saved_models = TrainedModelRepo.find_all_trainedmodel_by_user_id(
-            user_id=user.id
+            user_id=user_id
         )
 
         training_file.start_train = True
         TrainingFileRepo.save_training_file()
 
-        TrainedModelRepo.start_trainedmodel(user_id=user.id, model_id=model_id)
+        TrainedModelRepo.start_trainedmodel(user_id=user_id, model_id=model_id)
 
         model_path = os.path.join("..\\saved_models", trained_model.modelname)
         print(model_path)
@@ -208,6 +207,16 @@ def clean_result_store():
 threading.Thread(target=clean_result_store, daemon=True).start()
 
 
+def store_responses(request_id, input_text, responses):
+    result_store[request_id] = {
+        "status": "success",
+        "result": [
+            {"input": input_text, "output": response} for response in responses
+        ],
+        "msg": f"成功取得{len(responses)}筆回答",
+    }
+
+
 def process_requests(app):
     with app.app_context():
         while True:
@@ -222,23 +231,27 @@ def process_requests(app):
                 ) = request_queue.get()
 
                 try:
-                    responses = inference(
-                        model_dir, modelname, input_text, user_id, session_history
-                    )
-                    if responses is None:
+                    generated = generate_candidates(model_dir, input_text, user_id)
+                    if generated is None:
                         result_store[request_id] = {
                             "status": "error",
                             "message": "Inference failed",
                         }
                     else:
-                        result_store[request_id] = {
-                            "status": "success",
-                            "result": [
-                                {"input": input_text, "output": response}
-                                for response in responses
-                            ],
-                            "msg": f"成功取得{len(responses)}筆回答",
-                        }
+                        candidates, chat, logprobs = generated
+                        if chat is None:
+                            store_responses(request_id, input_text, candidates)
+                        else:
+                            # 修正階段在背景執行，GPU 直接處理下一個請求
+                            refinement_stage.submit(
+                                candidates,
+                                input_text,
+                                modelname,
+                                chat,
+                                session_history,
+                                callback=partial(store_responses, request_id, input_text),
+                                logprobs=logprobs,
+                            )
                 except Exception as e:
                     result_store[request_id] = {"status": "error", "message": str(e)}
 
@@ -333,14 +346,10 @@ def process_requests(app):
     }
 )
 def chat():
-    current_email = get_jwt_identity()
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
-    user_id = user.id
     is_shared = request.form.get("is_shared")
     modelname = request.form.get("modelname")
     if not modelname:
@@ -381,13 +390,13 @@ def chat():
         return jsonify({"error": "Invalid session_history JSON"}), 400
 
     # 創建唯一的請求 ID
-    request_id = f"{time.time()}_{user.id}"
+    request_id = f"{time.time()}_{user_id}"
     request_data = (
         request_id,
         model_dir,
         modelname,
         input_text,
-        user.id,
+        user_id,
         session_history,
     )
 
@@ -461,21 +470,18 @@ def chat_result(request_id):
     }
 )
 def share_model():
-    current_email = get_jwt_identity()
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
     # parameter
     modelname = request.form.get("modelname")
     #
     model = TrainedModelRepo.find_trainedmodel_by_user_and_modelname(
-        user_id=user.id, modelname=modelname
+        user_id=user_id, modelname=modelname
     )
     if model is None:
         return jsonify(message="無法找到模型"), 404
-    if model.user_id != user.id:
+    if model.user_id != user_id:
         return jsonify(message="無法取用該模型"), 403
     shared_model = SharedModelRepo.create_shared_model(model)
     if shared_model is None:
@@ -523,13 +529,10 @@ def share_model():
     }
 )
 def get_shared_model(link: str):
-    current_email = get_jwt_identity()
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
-    res = SharedModelRepo.obtain_shared_model(link, user.id)
+    res = SharedModelRepo.obtain_shared_model(link, user_id)
     # 成功
     if res["res"]:
         return jsonify(message=res["msg"]), 200
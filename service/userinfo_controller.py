@@ -5,20 +5,20 @@ from flasgger import swag_from
 import logging
 import json
 
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask_jwt_extended import jwt_required
 
 from repository.trainedmodel_repo import TrainedModelRepo
 from repository.trainingfile_repo import TrainingFileRepo
 from repository.userphoto_repo import UserPhotoRepo
-from models.user import User
+from utils.current_user import current_user_id
+from utils.image_derivatives import SIZES, delete_derivatives, find_derivative, image_worker
+from utils.serializers import image_url
 
 userinfo_bp = Blueprint("userinfo", __name__)
 logger = logging.getLogger(__name__)
 
 FILE_DIRECTORY = os.path.abspath("..\\user_photo_file")
 TRAINING_FILE_DIRECTORY = os.path.abspath("..\\training_file")
-# BASE_URL = "http://192.168.1.109:8080" # 安的IP
-BASE_URL = "https://nccu-group-8.work"  # 主機IP
 
 
 def allowed_file(filename, extensions):
@@ -92,17 +92,10 @@ def allowed_file(filename, extensions):
     }
 )
 def upload_photo():
-    current_email = get_jwt_identity()
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
-    user_exists = User.is_user_id_exists(user.id)
-    if not user_exists:
-        return jsonify({"error": "User ID not found"}), 404
-
     # 檢查是否有檔案
     if "file" not in request.files:
         return jsonify({"error": "No file part in the request"}), 400
@@ -119,18 +112,20 @@ def upload_photo():
         if not os.path.exists(FILE_DIRECTORY):
             os.makedirs(FILE_DIRECTORY)
 
-        current_file = UserPhotoRepo.find_user_photo_by_user_id(user_id=user.id)
+        current_file = UserPhotoRepo.find_user_photo_by_user_id(user_id=user_id)
 
-        user_folder = os.path.join(FILE_DIRECTORY, str(user.id))
+        user_folder = os.path.join(FILE_DIRECTORY, str(user_id))
 
         # 上傳新的覆蓋舊的，把舊的file實體刪除
         if current_file:
-            os.remove(os.path.join(user_folder, current_file.photoname))
-            UserPhotoRepo.delete_user_photo_by_user_id(user.id)
+            old_file_path = os.path.join(user_folder, current_file.photoname)
+            os.remove(old_file_path)
+            delete_derivatives(old_file_path)
+            UserPhotoRepo.delete_user_photo_by_user_id(user_id)
 
         # 儲存檔案
         saved_file = UserPhotoRepo.create_user_photo(
-            user_id=user.id, photoname=file.filename
+            user_id=user_id, photoname=file.filename
         )
         if not saved_file:
             return (
@@ -141,12 +136,15 @@ def upload_photo():
         if not os.path.exists(user_folder):
             os.makedirs(user_folder)
 
-        file.save(os.path.join(user_folder, saved_file.photoname))
+        file_path = os.path.join(user_folder, saved_file.photoname)
+        file.save(file_path)
+        # 背景產生縮圖與 WebP
+        image_worker.enqueue(file_path)
         return (
             jsonify(
                 {
                     "message": "File uploaded successfully",
-                    "user_avatar": f"{BASE_URL}/userinfo/images/{user.id}/{saved_file.photoname}",
+                    "user_avatar": image_url(user_id, saved_file.photoname),
                 }
             ),
             200,
@@ -254,11 +252,29 @@ def upload_photo():
                 "required": True,
                 "description": "User information in JSON format",
             },
+            {
+                "name": "size",
+                "in": "query",
+                "type": "string",
+                "required": False,
+                "enum": ["original", *SIZES],
+                "description": "圖片尺寸，預設為原圖。small/medium/large 的最長邊分別為 "
+                + "/".join(str(pixels) for pixels in SIZES.values())
+                + " px；Accept 標頭包含 image/webp 或 format=webp 時回傳 WebP",
+            },
+            {
+                "name": "format",
+                "in": "query",
+                "type": "string",
+                "required": False,
+                "enum": ["webp"],
+                "description": "強制回傳 WebP",
+            },
         ],
         "responses": {
             "200": {
                 "description": "成功回傳使用者頭像",
-                "content": {"image/jpeg": {}, "image/png": {}, "image/jpg": {}},
+                "content": {"image/jpeg": {}, "image/png": {}, "image/jpg": {}, "image/webp": {}},
             },
             "400": {
                 "description": "Bad request due to missing file or wrong file type",
@@ -278,19 +294,44 @@ def upload_photo():
     }
 )
 def get_image(id, photoname):
+    size = request.args.get("size", "original")
+    if size != "original" and size not in SIZES:
+        return jsonify({"error": f"size must be one of original, {', '.join(SIZES)}"}), 400
+
+    # id 只能是 default 或使用者 ID，避免以 ../ 讀取或在 user_photo_file 以外產生縮圖
+    if id != "default" and not id.isdigit():
+        return jsonify({"error": "Bad request - invalid path"}), 400
+
     if id == "default":
         file_path = os.path.join(FILE_DIRECTORY, "default", photoname)
     else:
         file_path = os.path.join(FILE_DIRECTORY, str(id), photoname)
 
-    if not os.path.exists(file_path):
+    # photoname 為 .. 時會指到目錄，不能當成圖片
+    if not os.path.isfile(file_path):
         default_image_path = os.path.join(FILE_DIRECTORY, "default", "avatar.png")
-        if os.path.exists(default_image_path):
-            return send_file(default_image_path, mimetype="image/png")
-        else:
+        if not os.path.exists(default_image_path):
             return jsonify({"error": "User or photo not found"}), 404
+        file_path = default_image_path
+
+    derivative = None
+    if size != "original":
+        # 只有明確列出 image/webp 才回傳 WebP（*/* 不算）
+        webp = request.args.get("format") == "webp" or "image/webp" in request.accept_mimetypes.values()
+        derivative = find_derivative(file_path, size, webp)
+        if derivative is not None:
+            file_path = derivative
+        else:
+            # 還沒有縮圖（例如舊的圖片）時先回傳原圖，並排入背景產生
+            image_worker.enqueue(file_path)
 
-    return send_file(file_path, mimetype=mimetypes.guess_type(file_path)[0])
+    mimetype = mimetypes.guess_type(file_path)[0]
+    # 部分 Python 版本的 mimetypes 不認得 .webp，只有回傳 WebP 縮圖時才補上
+    if mimetype is None and derivative is not None and derivative.endswith(".webp"):
+        mimetype = "image/webp"
+    response = send_file(file_path, mimetype=mimetype)
+    response.vary.add("Accept")
+    return response
 
 
 @userinfo_bp.post("/user/create_model")
@@ -372,9 +413,7 @@ def get_image(id, photoname):
     }
 )
 def create_model():
-    current_email = get_jwt_identity()
-    user_id = User.get_user_by_email(current_email).id
-
+    user_id = current_user_id()
     if user_id is None:
         return jsonify({"error": "User ID not found"}), 404
 
@@ -420,7 +459,10 @@ def create_model():
             if not os.path.exists(user_folder):
                 os.makedirs(user_folder)
 
-            file.save(os.path.join(user_folder, saved_model.modelphoto))
+            file_path = os.path.join(user_folder, saved_model.modelphoto)
+            file.save(file_path)
+            # 背景產生縮圖與 WebP
+            image_worker.enqueue(file_path)
             return (
                 jsonify(
                     {
@@ -501,15 +543,13 @@ def create_model():
     }
 )
 def delete_model(model_id):
-    current_email = get_jwt_identity()
-    user = User.get_user_by_email(current_email)
-
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
     # 從資料庫中取得指定 model_id 的模型
     model = TrainedModelRepo.find_trainedmodel_by_user_and_model_id(
-        user_id=user.id, model_id=model_id
+        user_id=user_id, model_id=model_id
     )
 
     # 檢查模型是否存在
@@ -519,7 +559,7 @@ def delete_model(model_id):
         # 刪除該模型的訓練檔案
         model_training_file = (
             TrainingFileRepo.find_first_training_file_by_user_and_model_id(
-                user.id, model_id
+                user_id, model_id
             )
         )
         if model_training_file is not None:
@@ -534,7 +574,7 @@ def delete_model(model_id):
         # 刪除資料庫中的模型記錄
         delete_model_success = (
             TrainedModelRepo.delete_trainedmodel_by_user_and_model_id(
-                user_id=user.id, model_id=model_id
+                user_id=user_id, model_id=model_id
             )
         )
 
@@ -542,10 +582,11 @@ def delete_model(model_id):
             return jsonify({"error": "Unable to delete model from database"}), 500
 
         # 刪除模型照片
-        photo_folder = os.path.join(FILE_DIRECTORY, str(user.id))
+        photo_folder = os.path.join(FILE_DIRECTORY, str(user_id))
         file_path = os.path.join(photo_folder, model.modelphoto)
         if os.path.exists(file_path):
             os.remove(file_path)
+        delete_derivatives(file_path)
 
     except Exception as e:
         print(f"Error deleting model or related files: {e}")
@@ -4,18 +4,19 @@ from flask import (
     jsonify,
 )
 from flasgger import swag_from
-from flask_jwt_extended import get_jwt_identity, jwt_required
+from flask_jwt_extended import jwt_required
 from models import shared_model
 from repository.shared_model_repo import SharedModelRepo
 from repository.trainedmodel_repo import TrainedModelRepo
 from repository.trainingfile_repo import TrainingFileRepo
-from models.user import User
+from utils.current_user import current_user_id
 import json
 import os
 import logging
 import utils.linetxt_to_llama as linetxt_to_llama
 from typing import Dict
 from sqlalchemy.exc import SQLAlchemyError
+from utils.serializers import serialize_model_status, serialize_trained_model
 
 utils_bp = Blueprint("utils", __name__)
 logger = logging.getLogger(__name__)
@@ -23,24 +24,13 @@ logger = logging.getLogger(__name__)
 
 FILE_DIRECTORY = "..\\training_file"
 
-# BASE_URL = "http://192.168.1.109:8080" # 安的IP
-BASE_URL = "https://nccu-group-8.work"  # 主機IP
-
 
 def allowed_file(filename, extension):
     return "." in filename and filename.rsplit(".", 1)[1].lower() == extension
 
 
 def model_to_dict(model, is_shared=False) -> Dict:
-    return {
-        "model_id": model.id,
-        "user_id": model.user_id,
-        "modelname": model.modelname,
-        "model_original_name": model.model_original_name,
-        "modelphoto": f"{BASE_URL}/userinfo/images/{model.user_id}/{model.modelphoto}",
-        "anticipation": model.anticipation,
-        "is_shared": is_shared,
-    }
+    return serialize_trained_model(model, is_shared=is_shared)
 
 
 @utils_bp.post("/user/upload_csv_file")
@@ -115,11 +105,8 @@ def model_to_dict(model, is_shared=False) -> Dict:
     }
 )
 def upload_csv_file():
-    current_email = get_jwt_identity()
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
     user_info = request.form.get("user_info")
@@ -154,7 +141,7 @@ def upload_csv_file():
             os.makedirs(FILE_DIRECTORY)
 
         current_file = TrainingFileRepo.find_first_training_file_by_user_and_model_id(
-            user_id=user.id, model_id=model_id
+            user_id=user_id, model_id=model_id
         )
 
         is_renew = False  # 是否是覆蓋舊的
@@ -166,7 +153,7 @@ def upload_csv_file():
             is_renew = True
         # 儲存檔案
         saved_file = TrainingFileRepo.create_trainingfile(
-            user_id=user.id, model_id=model_id, original_file_name=file.filename
+            user_id=user_id, model_id=model_id, original_file_name=file.filename
         )
         if saved_file is None:
             return (
@@ -282,11 +269,8 @@ def upload_csv_file():
     }
 )
 def upload_txt_file():
-    current_email = get_jwt_identity()
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
     user_info = request.form.get("user_info")
@@ -323,7 +307,7 @@ def upload_txt_file():
 
         # 處理 line chat 的文件
         processor = linetxt_to_llama.LineChatProcessor(
-            output_name=user.id, master_name=master_name, data_dir=FILE_DIRECTORY
+            output_name=user_id, master_name=master_name, data_dir=FILE_DIRECTORY
         )
         try:
             csv_file_name = processor.process(file)  # process 方法需要文件來處理
@@ -332,7 +316,7 @@ def upload_txt_file():
 
         # 確認是否已有未完成的訓練文件，並刪除
         current_file = TrainingFileRepo.find_first_training_file_by_user_and_model_id(
-            user_id=user.id, model_id=model_id
+            user_id=user_id, model_id=model_id
         )
         if current_file is not None and not current_file.is_trained:
             try:
@@ -349,7 +333,7 @@ def upload_txt_file():
 
         # 儲存檔案
         saved_file = TrainingFileRepo.create_trainingfile(
-            user_id=user.id,
+            user_id=user_id,
             model_id=model_id,
             original_file_name=file.filename,
             filename=csv_file_name,
@@ -443,11 +427,8 @@ def upload_txt_file():
     }
 )
 def get_model_status(model_Id):
-    current_email = get_jwt_identity()
-
-    # 從資料庫中查詢使用者
-    user = User.get_user_by_email(current_email)
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
     model_exists = TrainedModelRepo.is_model_id_exists(model_Id)
@@ -457,7 +438,7 @@ def get_model_status(model_Id):
     try:
         # 查詢使用者的第一個已訓練模型
         trained_model_status = TrainedModelRepo.find_trainedmodel_by_user_and_model_id(
-            user.id, model_Id
+            user_id, model_Id
         )
         if not trained_model_status:
             return jsonify({"message": "No trained model found for this user."}), 404
@@ -470,7 +451,7 @@ def get_model_status(model_Id):
         # 查詢相關的訓練檔案
         training_file_status = (
             TrainingFileRepo.find_first_training_file_by_user_and_model_id(
-                user.id, model_Id
+                user_id, model_Id
             )
         )
 
@@ -492,31 +473,7 @@ def get_model_status(model_Id):
 
     return (
         jsonify(
-            {
-                "user_id": training_file_status.user_id,
-                "training_file_id": training_file_status.id,
-                "filename": training_file_status.filename,
-                "original_file_name": training_file_status.original_file_name,
-                "start_train": training_file_status.start_train,
-                "is_trained": training_file_status.is_trained,
-                "file_upload_time": training_file_status.upload_time.strftime(
-                    "%Y-%m-%d %H:%M:%S"
-                ),
-                "model_id": trained_model_status.id,
-                "model_name": trained_model_status.modelname,
-                "model_start_time": (
-                    trained_model_status.start_time.strftime("%Y-%m-%d %H:%M:%S")
-                    if trained_model_status.start_time is not None
-                    else "N/A"
-                ),
-                "model_end_time": (
-                    trained_model_status.end_time.strftime("%Y-%m-%d %H:%M:%S")
-                    if trained_model_status.end_time is not None
-                    else "N/A"
-                ),
-                "model_photo": f"{BASE_URL}/userinfo/images/{training_file_status.user_id}/{photo_path}",
-                "model_anticipation": trained_model_status.anticipation,
-            }
+            serialize_model_status(training_file_status, trained_model_status, photo_path)
         ),
         200,
     )
@@ -580,18 +537,16 @@ def get_model_status(model_Id):
     }
 )
 def get_all_model_info():
-    current_email = get_jwt_identity()
-    user = User.get_user_by_email(current_email)
-
-    if user is None:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify(message="使用者不存在"), 404
 
     try:
-        trainedmodels = TrainedModelRepo.find_all_trainedmodel_by_user_id(user.id)
+        trainedmodels = TrainedModelRepo.find_all_trainedmodel_by_user_id(user_id)
         if not trainedmodels:
             return jsonify(message="此使用者沒有任何訓練的模型"), 200
 
-        sharedmodels = SharedModelRepo.find_sharedmodels_by_acquirer_id(user.id)
+        sharedmodels = SharedModelRepo.find_sharedmodels_by_acquirer_id(user_id)
         # 取得sharemodel的trainedmodel
         sharedmodels_obj = [
             TrainedModelRepo.find_trainedmodel_by_model_id(model.model_id)
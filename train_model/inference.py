@@ -1,13 +1,22 @@
 import os
 import random
+import threading
 import torch
 import time
 import pandas as pd
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app, has_app_context
+from transformers import (
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    DynamicCache,
+    StoppingCriteria,
+    StoppingCriteriaList,
+)
 from peft import PeftModel
 from repository.trainingfile_repo import TrainingFileRepo
-from train_model.trim import analyze_and_modify_response
-from typing import List
+from train_model.refine_stage import refinement_stage
+from typing import List, Tuple
 from utils import chroma
 
 
@@ -19,6 +28,18 @@ usage_threshold = 5
 total_memory = torch.cuda.get_device_properties(0).total_memory
 threshold = int(total_memory * 0.75)
 
+# 準備 prompt 的各個階段（模型載入、few-shot、RAG）同時在 thread pool 中執行
+context_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="inference-context")
+# 各階段的 timeout（秒），few-shot 和 RAG 逾時就略過，模型載入逾時則放棄這次請求
+few_shot_timeout = float(os.getenv("FEW_SHOT_TIMEOUT", "3"))
+rag_timeout = float(os.getenv("RAG_TIMEOUT", "3"))
+model_load_timeout = float(os.getenv("MODEL_LOAD_TIMEOUT", "300"))
+# 避免逾時後仍在背景載入的模型和下一個請求同時修改 model_cache
+model_lock = threading.Lock()
+
+# 模型開始自己編下一輪對話時就停止生成
+stop_markers = ["User:", "Assistant:", "System:", "\nUser", "\n\n"]
+
 
 def manage_model_cache():
     global model_cache, model_usage_counter
@@ -44,6 +65,11 @@ def manage_model_cache():
 
 
 def load_model_for_user(model_dir: str, user_id: str):
+    with model_lock:
+        return _load_model_for_user(model_dir, user_id)
+
+
+def _load_model_for_user(model_dir: str, user_id: str):
     global model_cache, model_usage_counter
 
     if user_id in model_cache:
@@ -75,6 +101,89 @@ def load_model_for_user(model_dir: str, user_id: str):
     return model, tokenizer
 
 
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def prefill_prompt(model, inputs):
+    """
+    對 prompt 做一次 prefill，回傳除了最後一個 token 以外的 KV cache（legacy tuple 格式）。
+
+    最後一個 token 留給 generate 處理，generate 才會從它的 logits 開始取樣。
+    """
+    with torch.no_grad():
+        outputs = model(
+            input_ids=inputs["input_ids"][:, :-1],
+            attention_mask=inputs["attention_mask"][:, :-1],
+            use_cache=True,
+        )
+    past_key_values = outputs.past_key_values
+    if hasattr(past_key_values, "to_legacy_cache"):
+        past_key_values = past_key_values.to_legacy_cache()
+    return past_key_values
+
+
+def fork_cache(past_key_values, num_sequences: int) -> DynamicCache:
+    """把 prefill 的 KV cache 複製給每個取樣序列"""
+    return DynamicCache.from_legacy_cache(
+        tuple(
+            (
+                key.repeat_interleave(num_sequences, dim=0),
+                value.repeat_interleave(num_sequences, dim=0),
+            )
+            for key, value in past_key_values
+        )
+    )
+
+
+def mean_logprobs(model, outputs, pad_token_id) -> List[float]:
+    """計算每個生成序列中新 token 的平均 log-probability"""
+    transition_scores = model.compute_transition_scores(
+        outputs.sequences, outputs.scores, normalize_logits=True
+    )
+    generated_tokens = outputs.sequences[:, -transition_scores.shape[1] :]
+    mask = torch.isfinite(transition_scores)
+    if pad_token_id is not None:
+        mask &= generated_tokens != pad_token_id
+    totals = transition_scores.masked_fill(~mask, 0).sum(dim=1)
+    counts = mask.sum(dim=1).clamp(min=1)
+    return (totals / counts).tolist()
+
+
+class TurnStoppingCriteria(StoppingCriteria):
+    """生成的新 token 中出現對話標記或空行時，停止該序列的生成"""
+
+    def __init__(self, tokenizer, prompt_length: int, markers: List[str] = stop_markers):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.markers = markers
+
+    def __call__(self, input_ids, scores, **kwargs) -> torch.BoolTensor:
+        # 新 token 最多 max_new_tokens 個，整段解碼的成本遠低於一次 forward
+        texts = self.tokenizer.batch_decode(
+            input_ids[:, self.prompt_length :], skip_special_tokens=True
+        )
+        return torch.tensor(
+            [
+                any(marker in text.lstrip() for marker in self.markers)
+                for text in texts
+            ],
+            dtype=torch.bool,
+            device=input_ids.device,
+        )
+
+
+def cut_at_stop_marker(text: str) -> str:
+    """去掉第一個對話標記之後的內容"""
+    text = text.lstrip()
+    for marker in stop_markers:
+        index = text.find(marker)
+        if index != -1:
+            text = text[:index]
+    return text
+
+
 def limit_stickers(text: str) -> str:
     max_stickers = 2
     sticker_tokens = text.split("[貼圖]")
@@ -84,14 +193,71 @@ def limit_stickers(text: str) -> str:
     return text
 
 
-def inference(
+def load_few_shot(user_id: str, num_samples: int = 5) -> List[str]:
+    """從使用者的訓練檔案取最後幾筆對話作為 few-shot 範例"""
+    chat = []
+    user_history = TrainingFileRepo.find_trainingfile_by_user_id(user_id=user_id)
+    if isinstance(user_history, list) and user_history:
+        training_file = random.choice(user_history)
+    else:
+        training_file = user_history
+
+    if training_file and os.path.exists(training_file.filename):
+        with open(training_file.filename, "r") as f:
+            df = pd.read_csv(f)
+        if len(df) > num_samples:
+            df_sample = df.tail(n=num_samples)
+        else:
+            df_sample = df
+
+        for _, row in df_sample.iterrows():
+            chat.append(f"User: {row['input']}")
+            chat.append(f"Assistant: {row['output']}")
+    return chat
+
+
+def submit_stage(fn, *args, **kwargs):
+    """把工作丟進 thread pool，需要資料庫的工作會帶著目前的 app context"""
+    if not has_app_context():
+        return context_executor.submit(fn, *args, **kwargs)
+
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            return fn(*args, **kwargs)
+
+    return context_executor.submit(run)
+
+
+def stage_result(future, name: str, timeout: float, start: float, default=None):
+    """等待階段結果，逾時或失敗時回傳 default；timeout 從所有階段開始時起算"""
+    remaining = max(0.0, timeout - (time.perf_counter() - start))
+    try:
+        result = future.result(timeout=remaining)
+        print(f"[INFO] Stage {name} finished at {(time.perf_counter() - start) * 1000:.1f}ms")
+        return result
+    except FutureTimeoutError:
+        print(f"[WARN] Stage {name} timed out after {timeout}s. Skipping.")
+    except Exception as e:
+        print(f"[ERROR] Stage {name} failed: {e}")
+    return default
+
+
+def generate_candidates(
     model_dir: str,
-    modelname: str,
     input_text: str,
     user_id: str,
-    session_history: List[dict],
     max_retries: int = 3,
-) -> List[str] | None:
+) -> Tuple[List[str], List[str] | None, List[float] | None] | None:
+    """
+    產生未經修正的候選回答。
+
+    Returns:
+    - (candidates, chat, logprobs)：chat 是修正階段需要的對話內容，為 None 時代表不需要修正；
+      logprobs 是每個候選回答的平均 log-probability，供品質閘門使用；
+      全部嘗試失敗時回傳 None。
+    """
     try:
         greetings = [
             "晚上好",
@@ -125,34 +291,30 @@ def inference(
         if input_text.lower().strip() in [greet.lower() for greet in greetings]:
             delay_seconds = random.uniform(3, 7)
             time.sleep(delay_seconds)
-            return [input_text]
-
-        model, tokenizer = load_model_for_user(model_dir, user_id)
+            return [input_text], None, None
+
+        # 模型載入、few-shot 讀取和 RAG 檢索彼此獨立，同時執行
+        stages_start = time.perf_counter()
+        model_future = submit_stage(load_model_for_user, model_dir, user_id)
+        few_shot_future = submit_stage(load_few_shot, user_id)
+        rag_future = submit_stage(
+            chroma.retrieve_context, user_id=user_id, query_texts=input_text
+        )
+
+        chat = stage_result(few_shot_future, "few-shot", few_shot_timeout, stages_start, [])
+        rag_context = stage_result(rag_future, "RAG", rag_timeout, stages_start, [])
+        loaded = stage_result(model_future, "model", model_load_timeout, stages_start)
+        if loaded is None:
+            return None
+        model, tokenizer = loaded
 
-        chat = []
-        user_history = TrainingFileRepo.find_trainingfile_by_user_id(user_id=user_id)
-        if isinstance(user_history, list) and user_history:
-            training_file = random.choice(user_history)
-        else:
-            training_file = user_history
-
-        if training_file and os.path.exists(training_file.filename):
-            with open(training_file.filename, "r") as f:
-                df = pd.read_csv(f)
-            num_samples = 5
-            if len(df) > num_samples:
-                df_sample = df.tail(n=num_samples)
-            else:
-                df_sample = df
-
-            for _, row in df_sample.iterrows():
-                chat.append(f"User: {row['input']}")
-                chat.append(f"Assistant: {row['output']}")
-
-        rag_content = chroma.retrive_n_results(user_id=user_id, query_texts=input_text)
-        if rag_content:
+        if rag_context:
+            print(
+                "[INFO] RAG context distances: "
+                f"{[item['distance'] for item in rag_context]}"
+            )
             chat.append("System: 以下是檢索到跟使用者相關內容，如果對話提及相關話題可以參考：")
-            chat.append(rag_content)
+            chat.append("\n".join(item["document"] for item in rag_context))
         chat.append(f"User: {input_text}")
         chat.append("Assistant:")
 
@@ -161,35 +323,59 @@ def inference(
         inputs = tokenizer(
             prompt, return_tensors="pt", padding=True, truncation=True, max_length=256
         ).to(model.device)
+        prompt_length = inputs["input_ids"].shape[1]
+        stopping_criteria = StoppingCriteriaList(
+            [TurnStoppingCriteria(tokenizer, prompt_length)]
+        )
+
+        # prompt 只 prefill 一次，每次嘗試和每個候選回答都共用同一份 KV cache
+        prefill_start = time.perf_counter()
+        prompt_cache = prefill_prompt(model, inputs)
+        synchronize(model.device)
+        prefill_ms = (time.perf_counter() - prefill_start) * 1000
 
         for attempt in range(max_retries):
             try:
                 generate_two_responses = random.random() < 0.5
                 num_return_sequences = 2 if generate_two_responses else 1
 
+                decode_start = time.perf_counter()
                 with torch.no_grad():
                     outputs = model.generate(
-                        input_ids=inputs["input_ids"],
-                        attention_mask=inputs["attention_mask"],
+                        input_ids=inputs["input_ids"].repeat_interleave(
+                            num_return_sequences, dim=0
+                        ),
+                        attention_mask=inputs["attention_mask"].repeat_interleave(
+                            num_return_sequences, dim=0
+                        ),
+                        past_key_values=fork_cache(prompt_cache, num_return_sequences),
                         do_sample=True,
                         # max_length=150,
                         max_new_tokens=50,
                         top_k=30,
                         top_p=0.85,
                         temperature=0.7,
-                        num_return_sequences=num_return_sequences,
+                        stopping_criteria=stopping_criteria,
+                        output_scores=True,
+                        return_dict_in_generate=True,
                     )
+                    logprobs = mean_logprobs(model, outputs, tokenizer.pad_token_id)
+                synchronize(model.device)
+                decode_ms = (time.perf_counter() - decode_start) * 1000
+                print(
+                    f"[INFO] Prompt tokens: {prompt_length}, sequences: {num_return_sequences}, "
+                    f"prefill: {prefill_ms:.1f}ms, decode: {decode_ms:.1f}ms"
+                )
 
                 responses = []
-                for i, output in enumerate(outputs):
+                for i, output in enumerate(outputs.sequences):
+                    # 只解碼新生成的 token，不含 prompt
                     generated_text = tokenizer.decode(
-                        output, skip_special_tokens=True
-                    ).strip()
+                        output[prompt_length:], skip_special_tokens=True
+                    )
+                    generated_text = cut_at_stop_marker(generated_text).strip()
                     generated_text = limit_stickers(generated_text)
 
-                    if "Assistant:" in generated_text:
-                        generated_text = generated_text.split("Assistant:")[-1].strip()
-
                     tags_to_remove = [
                         "ANTER",
                         "問：",
@@ -242,16 +428,13 @@ def inference(
                         line for line in generated_text.splitlines() if line.strip()
                     )
 
-                    generated_text = analyze_and_modify_response(
-                        input_text, generated_text, modelname, chat, session_history
-                    )
                     responses.append(generated_text)
 
-                    if any(responses):
-                        return responses
+                if any(responses):
+                    return responses, chat, logprobs
 
-                    print(f"[WARN] Attempt {attempt + 1}: Empty response. Retrying...")
-                    time.sleep(1)
+                print(f"[WARN] Attempt {attempt + 1}: Empty response. Retrying...")
+                time.sleep(1)
 
             except torch.cuda.OutOfMemoryError:
                 print(
@@ -267,9 +450,29 @@ def inference(
                 else:
                     print(f"[ERROR] Inference attempt {attempt + 1} failed: {e}")
 
-            print("[ERROR] All inference attempts failed or returned empty responses.")
-            return None
+        print("[ERROR] All inference attempts failed or returned empty responses.")
+        return None
 
     except Exception as e:
         print(f"Error in inference: {e}")
         return None
+
+
+def inference(
+    model_dir: str,
+    modelname: str,
+    input_text: str,
+    user_id: str,
+    session_history: List[dict],
+    max_retries: int = 3,
+) -> List[str] | None:
+    generated = generate_candidates(model_dir, input_text, user_id, max_retries)
+    if generated is None:
+        return None
+
+    candidates, chat, logprobs = generated
+    if chat is None:
+        return candidates
+    return refinement_stage.refine(
+        candidates, input_text, modelname, chat, session_history, logprobs
+    )
@@ -0,0 +1,103 @@
+import os
+import re
+import time
+from typing import List, Optional
+
+
+# 沒有明顯缺陷時，分數低於門檻才送去修正模型
+gate_threshold = float(os.getenv("REFINE_GATE_THRESHOLD", "0.6"))
+# 平均 log-probability 低於此值視為模型沒把握
+min_mean_logprob = float(os.getenv("REFINE_GATE_MIN_LOGPROB", "-2.5"))
+
+# 清理後仍殘留代表輸出混亂的片段（User、Assistant、INST 等已由 generate_candidates 移除，不需要列出）
+suspicious_fragments = ["SYS", "System", "Input", "Output"]
+# 貼圖佔位字串只有修正模型會換成 emoji，不能直接回傳給使用者
+sticker_placeholder = "[貼圖]"
+
+
+def find_defects(candidate: str, mean_logprob: Optional[float] = None) -> List[str]:
+    """
+    找出候選回答中的明顯缺陷，只要有任何一項就必須送去修正，不看分數。
+
+    使用者的問題已由 generate_candidates 從回答中移除，這裡不再檢查重複問題。
+
+    Returns:
+    - List[str]: 缺陷名稱，沒有缺陷時為空 list。
+    """
+    text = candidate.strip()
+    defects = []
+    if len(text) < 2:
+        defects.append("too_short")
+    # 殘留的對話標記
+    if any(fragment in text for fragment in suspicious_fragments):
+        defects.append("leftover_marker")
+    # 同一個字元連續重複
+    if re.search(r"(.)\1{5,}", text):
+        defects.append("repeated_chars")
+    # 貼圖佔位字串只有修正模型會換成 emoji
+    if sticker_placeholder in text:
+        defects.append("sticker_placeholder")
+    if mean_logprob is not None and mean_logprob < min_mean_logprob:
+        defects.append("low_logprob")
+    return defects
+
+
+def score_candidate(candidate: str, mean_logprob: Optional[float] = None) -> float:
+    """
+    以啟發式規則和生成時的 log-probability 為候選回答打分數。
+
+    Parameters:
+    - candidate (str): 清理後的候選回答。
+    - mean_logprob (float): 生成 token 的平均 log-probability，沒有時只用啟發式規則。
+
+    Returns:
+    - float: 0 到 1 之間的分數，越高代表越不需要修正。
+    """
+    text = candidate.strip()
+    if not text:
+        return 0.0
+
+    score = 1.0
+    # 太短或太長
+    if len(text) < 2:
+        score -= 0.4
+    elif len(text) > 120:
+        score -= 0.2
+    # 殘留的對話標記
+    if any(fragment in text for fragment in suspicious_fragments):
+        score -= 0.4
+    # 同一個字元連續重複
+    if re.search(r"(.)\1{5,}", text):
+        score -= 0.3
+    if mean_logprob is not None and mean_logprob < min_mean_logprob:
+        score -= min(0.5, (min_mean_logprob - mean_logprob) * 0.25)
+
+    return max(0.0, score)
+
+
+def select_for_refinement(
+    candidates: List[str],
+    logprobs: Optional[List[Optional[float]]] = None,
+    threshold: float = gate_threshold,
+) -> List[bool]:
+    """回傳每個候選回答是否需要送去修正，並記錄判斷結果與耗時"""
+    start = time.perf_counter()
+    if logprobs is None:
+        logprobs = [None] * len(candidates)
+
+    decisions = []
+    for i, (candidate, mean_logprob) in enumerate(zip(candidates, logprobs)):
+        score = score_candidate(candidate, mean_logprob)
+        defects = find_defects(candidate, mean_logprob)
+        # 有明顯缺陷的一律送去修正，不論分數
+        needs_refine = bool(defects) or score < threshold
+        decisions.append(needs_refine)
+        print(
+            f"[INFO] Quality gate candidate {i}: score={score:.2f} "
+            f"logprob={mean_logprob if mean_logprob is None else round(mean_logprob, 2)} "
+            f"defects={','.join(defects) or '-'} "
+            f"-> {'refine' if needs_refine else 'skip'}"
+        )
+
+    print(f"[INFO] Quality gate took {(time.perf_counter() - start) * 1000:.2f}ms")
+    return decisions
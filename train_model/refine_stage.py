@@ -0,0 +1,194 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+from train_model.quality_gate import select_for_refinement
+from train_model.trim import (
+    analyze_and_modify_response_async,
+    analyze_and_modify_responses_async,
+)
+
+
+# 同時送往修正模型的請求上限
+max_concurrency = int(os.getenv("REFINE_MAX_CONCURRENCY", "4"))
+# 每個請求的時間預算（秒，包含排隊等待併發名額的時間），超過就直接用原本的回答
+call_timeout = float(os.getenv("REFINE_TIMEOUT", "15"))
+# 多個候選回答時是否合併成一次請求
+batch_refine = os.getenv("REFINE_BATCH", "true").lower() == "true"
+
+
+class RefinementStage:
+    """
+    把回答修正（analyze_and_modify_response）獨立成一個 pipeline stage。
+
+    inference worker 產生候選回答後呼叫 submit() 就可以繼續處理下一個請求，
+    修正工作在背景的 event loop 中以 asyncio 執行，並以 semaphore 限制同時併發數。
+    每個請求有一個整體期限，等待 semaphore 的時間也計入其中，逾時或失敗時回傳原本的候選回答。
+    有多個候選回答時預設合併成一次請求，解析失敗才退回逐一修正。
+    送出前先經過本機的品質閘門，分數夠高的候選回答直接保留原文。
+    """
+
+    def __init__(
+        self,
+        concurrency: int = max_concurrency,
+        timeout: float = call_timeout,
+        batch: bool = batch_refine,
+    ):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.batch = batch
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = None
+        self._ready = threading.Event()
+        threading.Thread(target=self._run_loop, daemon=True).start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._ready.set()
+        self._loop.run_forever()
+
+    def _remaining(self, deadline):
+        return deadline - self._loop.time()
+
+    async def _with_slot(self, call, *args, timeout):
+        # 先取得併發名額再送出請求，整段都在外層 wait_for 的期限內
+        async with self._semaphore:
+            return await call(*args, timeout=timeout)
+
+    async def _refine_one(self, candidate, input_text, modelname, chat, session_history, deadline):
+        remaining = self._remaining(deadline)
+        if remaining <= 0:
+            print(f"[WARN] Refinement deadline of {self.timeout}s exceeded. Using raw candidate.")
+            return candidate
+        try:
+            return await asyncio.wait_for(
+                self._with_slot(
+                    analyze_and_modify_response_async,
+                    input_text,
+                    candidate,
+                    modelname,
+                    chat,
+                    session_history,
+                    timeout=remaining,
+                ),
+                timeout=remaining,
+            )
+        except asyncio.TimeoutError:
+            print(f"[WARN] Refinement timed out after {self.timeout}s. Using raw candidate.")
+            return candidate
+
+    async def _refine_batch(self, candidates, input_text, modelname, chat, session_history, deadline):
+        remaining = self._remaining(deadline)
+        try:
+            return await asyncio.wait_for(
+                self._with_slot(
+                    analyze_and_modify_responses_async,
+                    input_text,
+                    candidates,
+                    modelname,
+                    chat,
+                    session_history,
+                    timeout=remaining,
+                ),
+                timeout=remaining,
+            )
+        except asyncio.TimeoutError:
+            # 時間預算已用完，不再逐一重試
+            print(f"[WARN] Batch refinement timed out after {self.timeout}s. Using raw candidates.")
+            return candidates
+
+    async def _refine(self, candidates, input_text, modelname, chat, session_history, logprobs=None):
+        decisions = select_for_refinement(candidates, logprobs)
+        to_refine = [c for c, needs_refine in zip(candidates, decisions) if needs_refine]
+        if not to_refine:
+            return list(candidates)
+
+        refined = iter(
+            await self._refine_all(to_refine, input_text, modelname, chat, session_history)
+        )
+        return [
+            next(refined) if needs_refine else candidate
+            for candidate, needs_refine in zip(candidates, decisions)
+        ]
+
+    async def _refine_all(self, candidates, input_text, modelname, chat, session_history):
+        start = time.perf_counter()
+        # 整個請求共用同一個期限，合併請求失敗後的逐一修正也不會延長等待時間
+        deadline = self._loop.time() + self.timeout
+        if self.batch and len(candidates) > 1:
+            refined = await self._refine_batch(
+                candidates, input_text, modelname, chat, session_history, deadline
+            )
+            if refined is not None:
+                print(f"[INFO] Batch refined {len(candidates)} candidate(s) in {time.perf_counter() - start:.2f}s")
+                return refined
+            print("[WARN] Batch refinement failed. Falling back to per-candidate calls.")
+
+        refined = await asyncio.gather(
+            *[
+                self._refine_one(
+                    candidate, input_text, modelname, chat, session_history, deadline
+                )
+                for candidate in candidates
+            ]
+        )
+        print(f"[INFO] Refined {len(candidates)} candidate(s) in {time.perf_counter() - start:.2f}s")
+        return list(refined)
+
+    def submit(
+        self,
+        candidates: List[str],
+        input_text: str,
+        modelname: str,
+        chat: List[str],
+        session_history: List[dict],
+        callback: Callable[[List[str]], None],
+        logprobs: Optional[List[float]] = None,
+    ):
+        """排入修正工作，完成後以修正後的回答呼叫 callback"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._refine(
+                candidates, input_text, modelname, chat, session_history, logprobs
+            ),
+            self._loop,
+        )
+
+        def _done(fut):
+            try:
+                responses = fut.result()
+            except Exception as e:
+                print(f"[ERROR] Refinement stage failed: {e}")
+                responses = candidates
+            callback(responses)
+
+        future.add_done_callback(_done)
+        return future
+
+    def refine(
+        self,
+        candidates: List[str],
+        input_text: str,
+        modelname: str,
+        chat: List[str],
+        session_history: List[dict],
+        logprobs: Optional[List[float]] = None,
+    ) -> List[str]:
+        """同步等待修正結果"""
+        future = asyncio.run_coroutine_threadsafe(
+            self._refine(
+                candidates, input_text, modelname, chat, session_history, logprobs
+            ),
+            self._loop,
+        )
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"[ERROR] Refinement stage failed: {e}")
+            return candidates
+
+
+refinement_stage = RefinementStage()
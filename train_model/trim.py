@@ -1,17 +1,34 @@
+import json
 import openai
 import os
-from typing import List
+import re
+from typing import List, Optional
 from dotenv import load_dotenv
 
 
 load_dotenv(override=True)
 openai.api_key = os.getenv("OPENAI_API_KEY")
+# 可指向本機的替身 HTTP server 做測試
+if os.getenv("OPENAI_API_BASE"):
+    openai.api_base = os.getenv("OPENAI_API_BASE")
 
-def analyze_and_modify_response(input:str,response: str,name: str,chat_history_context:str,session_history:List[dict]) -> str:
+REFINE_MODEL = "gpt-4o"
+SYSTEM_PROMPT = (
+    "請根據歷史對話記錄學習用戶的說話風格，並用類似的語氣進行回應，請專注於回答用戶問題，而不是重新表述用戶的話，避免不合理的回覆。"
+    "回答應該自然、親近，像親密好友表現出關心和支持，避免用正式的語氣，且不能透露自己是人工智慧模型"
+)
+
+
+def _refine_messages(target: str, input: str, outputs: str, output_format: str, name: str, chat_history_context: str, session_history: List[dict]) -> List[dict]:
+    """
+    單一與批次修正共用的 prompt，修正規則只在這裡維護。
+
+    target 是要檢查的對象，outputs 是候選回答，output_format 是返回格式的說明。
+    """
     prompt = (
         f"以下是用戶的歷史對話記錄，請模仿該用戶 output 的說話風格進行回應：\n"
         f"{chat_history_context}\n\n"
-        f"請檢查以下對話，檢查是否是符合情境的回答，並根據用戶的語氣進行修正：\n"
+        f"請{target}，檢查是否是符合情境的回答，並根據用戶的語氣進行修正：\n"
         f"1. 如果情境回答合理，保留不變；\n"
         f"2. 如果情境回答不合理，請根據用戶的語氣做修正；\n"
         f"3. 不得包含與語境無關或令人困惑的內容；\n"
@@ -20,29 +37,110 @@ def analyze_and_modify_response(input:str,response: str,name: str,chat_history_c
         f"6. 若有問你是誰或是你的名字，請回答你是{name}"
         f"這邊是前面幾次的對話，請讓整個對話符合邏輯：{session_history}"
         f"Input: {input}\n\n"
-        f"Output: {response}\n\n"
-        f"返回結果應只有修正後的 Output，無其他說明。"
+        f"{outputs}\n\n"
+        f"{output_format}"
     )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
 
+def build_refine_messages(input:str,response: str,name: str,chat_history_context:str,session_history:List[dict]) -> List[dict]:
+    return _refine_messages(
+        "檢查以下對話",
+        input,
+        f"Output: {response}",
+        "返回結果應只有修正後的 Output，無其他說明。",
+        name,
+        chat_history_context,
+        session_history,
+    )
+
+
+def analyze_and_modify_response(input:str,response: str,name: str,chat_history_context:str,session_history:List[dict]) -> str:
     try:
         final_response = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "請根據歷史對話記錄學習用戶的說話風格，並用類似的語氣進行回應，請專注於回答用戶問題，而不是重新表述用戶的話，避免不合理的回覆。"
-                        "回答應該自然、親近，像親密好友表現出關心和支持，避免用正式的語氣，且不能透露自己是人工智慧模型"
-                    ),
-                },
-                {"role": "user", "content": prompt},
-            ],
+            model=REFINE_MODEL,
+            messages=build_refine_messages(
+                input, response, name, chat_history_context, session_history
+            ),
             temperature=0.8,
         )
 
         return final_response["choices"][0]["message"]["content"]
 
-        
+
     except Exception as e:
         print(f"Error in inference API")
-        return response
\ No newline at end of file
+        return response
+
+
+async def analyze_and_modify_response_async(input:str,response: str,name: str,chat_history_context:str,session_history:List[dict],timeout: float = 15.0) -> str:
+    """非同步版本，超過 timeout 或失敗時回傳原本的 response"""
+    try:
+        final_response = await openai.ChatCompletion.acreate(
+            model=REFINE_MODEL,
+            messages=build_refine_messages(
+                input, response, name, chat_history_context, session_history
+            ),
+            temperature=0.8,
+            request_timeout=timeout,
+        )
+
+        return final_response["choices"][0]["message"]["content"]
+
+    except Exception as e:
+        print(f"Error in async inference API: {e}")
+        return response
+
+
+def build_batch_refine_messages(input:str,responses: List[str],name: str,chat_history_context:str,session_history:List[dict]) -> List[dict]:
+    candidates = "\n".join(
+        f"Output {i + 1}: {response}" for i, response in enumerate(responses)
+    )
+    return _refine_messages(
+        f"逐一檢查以下 {len(responses)} 個候選回答",
+        input,
+        candidates,
+        f"返回結果只能是一個 JSON 字串陣列，依序包含 {len(responses)} 個修正後的 Output，無其他說明。",
+        name,
+        chat_history_context,
+        session_history,
+    )
+
+
+def parse_batch_response(content: str, expected: int) -> Optional[List[str]]:
+    """解析批次修正的 JSON 陣列，格式或數量不符時回傳 None"""
+    match = re.search(r"\[.*\]", content, re.DOTALL)
+    if match is None:
+        return None
+    try:
+        parsed = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(parsed, list) or len(parsed) != expected:
+        return None
+    if not all(isinstance(item, str) for item in parsed):
+        return None
+    return parsed
+
+
+async def analyze_and_modify_responses_async(input:str,responses: List[str],name: str,chat_history_context:str,session_history:List[dict],timeout: float = 15.0) -> Optional[List[str]]:
+    """一次請求修正所有候選回答，失敗或無法解析時回傳 None"""
+    try:
+        final_response = await openai.ChatCompletion.acreate(
+            model=REFINE_MODEL,
+            messages=build_batch_refine_messages(
+                input, responses, name, chat_history_context, session_history
+            ),
+            temperature=0.8,
+            request_timeout=timeout,
+        )
+
+        content = final_response["choices"][0]["message"]["content"]
+        return parse_batch_response(content, len(responses))
+
+    except Exception as e:
+        print(f"Error in batch inference API: {e}")
+        return None
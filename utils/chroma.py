@@ -1,20 +1,100 @@
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
 import chromadb
+
+from utils import hybrid_retriever
+from utils.embedding_backend import get_embedding_function
+from utils.retrieval_cache import retrieval_cache
  
 
 # 向量資料庫路徑
 path = "./chroma"
+# 最多快取幾個 collection handle
+collection_cache_size = int(os.getenv("CHROMA_COLLECTION_CACHE_SIZE", "256"))
+# collection 配置：
+# - per_user：每個使用者一個 collection_{user_id}
+# - sharded：依 user_id hash 分到固定數量的 events_shard_NNN，以 user_id metadata 過濾
+# - migrating：從 per_user 搬到 sharded 的過渡期，讀 per_user、同時寫入兩邊
+layout = os.getenv("CHROMA_LAYOUT", "per_user")
+shard_count = int(os.getenv("CHROMA_SHARDS", "16"))
+# RAG 內容的篩選條件：向量距離上限、混合分數下限、重複判定門檻、總字數上限
+rag_max_distance = float(os.getenv("RAG_MAX_DISTANCE", "1.2"))
+rag_min_score = float(os.getenv("RAG_MIN_SCORE", "0.3"))
+rag_dedup_similarity = float(os.getenv("RAG_DEDUP_SIMILARITY", "0.8"))
+rag_max_chars = int(os.getenv("RAG_MAX_CHARS", "300"))
+
+# 整個 process 共用一個 client，避免每次都重新開啟 SQLite 和 HNSW 檔案
+_client = None
+_client_lock = threading.Lock()
+_collections = OrderedDict()
+_collections_lock = threading.Lock()
+# 向量資料的寫入（index queue、layout 搬移）都要拿這個 lock，避免互相覆蓋
+write_lock = threading.RLock()
 
 def init_db_client():
-    """初始化資料庫"""
-    chroma_client = chromadb.PersistentClient(path=path)
-    return chroma_client
+    """初始化資料庫，整個 process 只建立一次"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = chromadb.PersistentClient(path=path)
+    return _client
  
 def create_collection(collection_name):
-    """創建collection"""
+    """創建collection，handle 會放進 LRU 快取"""
+    with _collections_lock:
+        collection = _collections.get(collection_name)
+        if collection is not None:
+            _collections.move_to_end(collection_name)
+            return collection
+
     chroma_client = init_db_client()
-    collection=chroma_client.get_or_create_collection(name=collection_name)
+    collection=chroma_client.get_or_create_collection(
+        name=collection_name, embedding_function=get_embedding_function()
+    )
+
+    with _collections_lock:
+        _collections[collection_name] = collection
+        _collections.move_to_end(collection_name)
+        while len(_collections) > collection_cache_size:
+            _collections.popitem(last=False)
     return collection
 
+def evict_collection(collection_name):
+    """從快取移除 collection handle（例如 collection 被刪除時）"""
+    with _collections_lock:
+        _collections.pop(collection_name, None)
+
+def per_user_collection_name(user_id):
+    return f"collection_{user_id}"
+
+def shard_collection_name(user_id):
+    """以 user_id 的 hash 決定所屬的 shard"""
+    return f"events_shard_{zlib.crc32(str(user_id).encode()) % shard_count:03d}"
+
+def user_collection(user_id):
+    """
+    取得讀取使用者事件時要用的 collection 與 where 條件。
+
+    Returns:
+    - (collection, where)：per_user 配置的 where 為 None。
+    """
+    if layout == "sharded":
+        return create_collection(shard_collection_name(user_id)), {"user_id": user_id}
+    return create_collection(per_user_collection_name(user_id)), None
+
+def user_write_targets(user_id):
+    """取得寫入使用者事件時要寫的所有 collection，搬移期間兩種配置都要寫"""
+    if layout == "migrating":
+        return [
+            create_collection(per_user_collection_name(user_id)),
+            create_collection(shard_collection_name(user_id)),
+        ]
+    return [user_collection(user_id)[0]]
+
 def add_document(collection, document, id, metadata):
     """新增單筆資料"""
     collection.add(
@@ -43,28 +123,160 @@ def delete_document(collection, id):
     """刪除資料"""
     collection.delete(id)
 
+def upsert_documents(collection, ids, documents, metadatas, embeddings=None):
+    """批次新增或更新資料，有提供 embeddings 時不會重新計算向量"""
+    collection.upsert(
+        ids=ids,
+        documents=documents,
+        metadatas=metadatas,
+        embeddings=embeddings
+    )
+
+def get_metadatas(collection, ids):
+    """批次查詢資料的 metadata，回傳 {id: metadata}"""
+    results = collection.get(ids=ids, include=["metadatas"])
+    return dict(zip(results["ids"], results["metadatas"]))
+
+def update_metadatas(collection, ids, metadatas):
+    """只更新 metadata，不會重新計算向量"""
+    collection.update(
+        ids=ids,
+        metadatas=metadatas
+    )
+
+def delete_documents(collection, ids):
+    """批次刪除資料"""
+    collection.delete(ids=ids)
+
 def query(collection, query_texts, n_results):
     """檢索資料"""
     return collection.query(
         query_texts=query_texts,
         n_results=n_results
     )
+def _and_where(*conditions):
+    conditions = [condition for condition in conditions if condition]
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    flattened = []
+    for condition in conditions:
+        flattened.extend(condition.get("$and", [condition]))
+    return {"$and": flattened}
+
+def hybrid_query(user_id, query_text, n_results):
+    """
+    日期感知的混合檢索。
+
+    先從輸入中抽出日期區間作為 metadata 過濾條件，再合併向量檢索與字元 bigram BM25 的分數。
+    日期區間內沒有任何結果時，退回不過濾日期的檢索。
+
+    Returns:
+    - dict: 'ids'、'documents'、'distances'（只由 BM25 命中的為 None）、'scores'。
+    """
+    collection, user_where = user_collection(user_id)
+    empty = {"ids": [], "documents": [], "distances": [], "scores": []}
+    total = collection.count()
+    if total == 0:
+        return empty
+
+    date_range = hybrid_retriever.extract_date_range(query_text)
+    # 多取一些候選，讓 BM25 有機會調整排序
+    candidates = min(total, max(n_results * 4, 10))
+    results = collection.query(
+        query_texts=[query_text],
+        n_results=candidates,
+        where=_and_where(user_where, hybrid_retriever.date_range_where(date_range)),
+        include=["documents", "distances"],
+    )
+    if date_range is not None and not results["ids"][0]:
+        date_range = None
+        results = collection.query(
+            query_texts=[query_text],
+            n_results=candidates,
+            where=user_where,
+            include=["documents", "distances"],
+        )
+
+    documents = dict(zip(results["ids"][0], results["documents"][0]))
+    distances = dict(zip(results["ids"][0], results["distances"][0]))
+    bm25_index = hybrid_retriever.get_bm25_index(user_id, collection, user_where)
+    bm25_scores = bm25_index.search(query_text, date_range)
+
+    ranked = hybrid_retriever.combine_scores(distances, bm25_scores)[:n_results]
+    return {
+        "ids": [id for id, _ in ranked],
+        "documents": [documents.get(id) or bm25_index.documents.get(id) for id, _ in ranked],
+        "distances": [distances.get(id) for id, _ in ranked],
+        "scores": [score for _, score in ranked],
+    }
+
+def _similarity(a, b):
+    """字元 bigram 的 Jaccard 相似度"""
+    a, b = set(hybrid_retriever.bigrams(a)), set(hybrid_retriever.bigrams(b))
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def select_context(results, n_results, max_distance=None, min_score=None, max_chars=None):
+    """
+    篩選要放進 prompt 的檢索結果：去掉距離太遠、分數太低、與已選內容幾乎相同的文件，
+    並限制總字數。
+
+    Returns:
+    - list: [{'id', 'document', 'distance', 'score'}]，依相關程度排序。
+    """
+    max_distance = rag_max_distance if max_distance is None else max_distance
+    min_score = rag_min_score if min_score is None else min_score
+    max_chars = rag_max_chars if max_chars is None else max_chars
+
+    selected = []
+    used_chars = 0
+    for id, document, distance, score in zip(
+        results["ids"], results["documents"], results["distances"], results["scores"]
+    ):
+        if len(selected) >= n_results or used_chars >= max_chars:
+            break
+        if not document:
+            continue
+        if distance is not None and distance > max_distance:
+            continue
+        if score < min_score:
+            continue
+        if any(_similarity(document, item["document"]) >= rag_dedup_similarity for item in selected):
+            continue
+        document = document[: max_chars - used_chars]
+        used_chars += len(document)
+        selected.append({"id": id, "document": document, "distance": distance, "score": score})
+    return selected
+
+def retrieve_context(user_id, query_texts, n_results=3):
+    """
+    檢索要放進 prompt 的相關內容，連同距離和分數一起回傳，讓 prompt 組裝時可以再判斷。
+
+    Returns:
+    - list: [{'id', 'document', 'distance', 'score'}]。
+    """
+    if isinstance(query_texts, list):
+        query_texts = " ".join(str(text) for text in query_texts)
+
+    # 同一個使用者重複的查詢直接從快取取得
+    context = retrieval_cache.get(user_id, query_texts, n_results)
+    if context is not None:
+        return context
+
+    version = retrieval_cache.version(user_id)
+    # 多取一倍的候選，篩選後才有足夠的結果
+    results = hybrid_query(user_id, query_texts, n_results * 2)
+    context = select_context(results, n_results)
+    retrieval_cache.put(user_id, query_texts, n_results, context, version)
+
+    return context
+
 def retrive_n_results(user_id, query_texts, n_results=3):
     """檢索資料"""
-    collection_name = f"collection_{user_id}"
-    collection = create_collection(collection_name)
-    results = query(collection, query_texts, n_results)["documents"]  # 獲取檢索結果中的文檔內容
-    
-    # print("Results type:", type(results))  # 檢查 results 的類型
-    # print("First item type:", type(results[0]))  # 檢查第一個項目的類型
-    
-    # 如果 results 是巢狀列表，先展平它
-    if isinstance(results, list) and any(isinstance(item, list) for item in results):
-        flattened_results = [item for sublist in results for item in sublist]
-        content = "\n".join(str(text) for text in flattened_results)
-    else:
-        content = "\n".join(str(text) for text in results)
-    
-    return content
+    context = retrieve_context(user_id, query_texts, n_results)
+    return "\n".join(item["document"] for item in context)
 
 # print(retrive_n_results(57, "文化日活動",1))
\ No newline at end of file
@@ -0,0 +1,113 @@
+import argparse
+import logging
+import re
+import threading
+
+from utils import chroma, hybrid_retriever
+
+logger = logging.getLogger(__name__)
+
+PER_USER_PATTERN = re.compile(r"^collection_(\d+)$")
+
+
+def per_user_collections():
+    """列出所有 per_user 配置的 collection，回傳 [(user_id, collection_name)]"""
+    client = chroma.init_db_client()
+    names = [getattr(collection, "name", collection) for collection in client.list_collections()]
+    return [
+        (int(match.group(1)), name)
+        for name in names
+        if (match := PER_USER_PATTERN.match(name))
+    ]
+
+
+def migrate_user(user_id, batch_size=500, delete_source=False):
+    """
+    把一個使用者的 collection_{user_id} 複製到對應的 shard。
+
+    向量連同 documents、metadatas 一起複製，不會重新 embedding。
+    複製期間持有 chroma.write_lock，和 index queue 的寫入互斥。
+
+    Returns:
+    - int: 複製的筆數。
+    """
+    client = chroma.init_db_client()
+    source_name = chroma.per_user_collection_name(user_id)
+    target = chroma.create_collection(chroma.shard_collection_name(user_id))
+
+    with chroma.write_lock:
+        source = chroma.create_collection(source_name)
+        copied = 0
+        offset = 0
+        while True:
+            batch = source.get(
+                limit=batch_size,
+                offset=offset,
+                include=["documents", "metadatas", "embeddings"],
+            )
+            if not batch["ids"]:
+                break
+            target.upsert(
+                ids=batch["ids"],
+                documents=batch["documents"],
+                embeddings=[[float(value) for value in embedding] for embedding in batch["embeddings"]],
+                metadatas=[
+                    {**(metadata or {}), "user_id": user_id} for metadata in batch["metadatas"]
+                ],
+            )
+            copied += len(batch["ids"])
+            offset += batch_size
+
+        migrated = target.get(where={"user_id": user_id}, include=[])
+        if len(migrated["ids"]) < copied:
+            raise RuntimeError(
+                f"Shard has {len(migrated['ids'])} documents for user {user_id}, expected {copied}"
+            )
+
+        if delete_source:
+            client.delete_collection(source_name)
+            chroma.evict_collection(source_name)
+
+    hybrid_retriever.invalidate(user_id)
+    return copied
+
+
+def migrate_all(batch_size=500, delete_source=False):
+    """搬移所有 per_user collection，單一使用者失敗不影響其他使用者"""
+    collections = per_user_collections()
+    logger.info(f"Migrating {len(collections)} per-user collections to {chroma.shard_count} shards")
+    failed = []
+    for user_id, _ in collections:
+        try:
+            copied = migrate_user(user_id, batch_size, delete_source)
+            logger.info(f"Migrated {copied} documents for user {user_id}")
+        except Exception as e:
+            logger.error(f"Error migrating collection for user {user_id}: {e}")
+            failed.append(user_id)
+    if failed:
+        logger.error(f"Migration finished with failures for users: {failed}")
+    else:
+        logger.info("Migration complete. Set CHROMA_LAYOUT=sharded and restart to read from shards.")
+    return failed
+
+
+def start_background_migration():
+    """
+    CHROMA_LAYOUT=migrating 時在 server 啟動後背景搬移。
+
+    搬移期間讀取仍使用 per_user collection，新的寫入同時寫到兩種配置，
+    所以搬移完成前後服務都不用停。
+    """
+    if chroma.layout != "migrating":
+        return
+    threading.Thread(target=migrate_all, daemon=True).start()
+
+
+if __name__ == "__main__":
+    # 離線搬移用（server 停止時執行）；線上搬移請設定 CHROMA_LAYOUT=migrating 後啟動 server
+    parser = argparse.ArgumentParser(description="Migrate per-user Chroma collections to sharded collections.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--delete-source", action="store_true", help="搬移並驗證後刪除原本的 collection")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    migrate_all(args.batch_size, args.delete_source)
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g
+from flask_jwt_extended import get_jwt, get_jwt_identity
+
+from extensions import db
+from models.user import User
+
+# access / refresh token 中存放使用者 ID 的 claim
+USER_ID_CLAIM = "uid"
+# 已確認存在的使用者 ID 要記住幾秒（帳號刪除後最多這麼久仍會被視為存在）
+cache_ttl = float(os.getenv("CURRENT_USER_CACHE_TTL", "60"))
+# 記憶體內最多保留幾個使用者
+cache_size = int(os.getenv("CURRENT_USER_CACHE_SIZE", "10000"))
+
+
+class TTLCache:
+    """有存活時間與數量上限的 LRU 快取，多個 thread 共用"""
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+# 使用者 ID -> True：token 中的 ID 最近確認過仍存在
+_existing_user_ids = TTLCache(cache_ttl, cache_size)
+# email -> 使用者 ID：沒有 uid claim 的舊 token 使用
+_user_ids_by_email = TTLCache(cache_ttl, cache_size)
+
+
+def identity_claims(user_id):
+    """簽發 token 時一併放入的 claim，之後的請求不需要再以 email 查詢使用者"""
+    return {USER_ID_CLAIM: user_id}
+
+
+def current_user_id():
+    """
+    取得目前請求的使用者 ID，同一個請求只會解析一次。
+
+    優先使用 token 中的 uid claim，並以短時間的快取確認使用者仍存在；
+    沒有 uid claim 的舊 token 則以 email 查詢一次後快取。
+
+    Returns:
+    - int: 使用者 ID；使用者不存在時返回 None。
+    """
+    if "current_user_id" in g:
+        return g.current_user_id
+
+    user_id = get_jwt().get(USER_ID_CLAIM)
+    if user_id is None:
+        email = get_jwt_identity()
+        user_id = _user_ids_by_email.get(email)
+        if user_id is None:
+            user = User.get_user_by_email(email)
+            if user is not None:
+                user_id = user.id
+                g.current_user = user
+                _user_ids_by_email.put(email, user_id)
+                _existing_user_ids.put(user_id, True)
+    elif not _existing_user_ids.get(user_id):
+        if User.is_user_id_exists(user_id):
+            _existing_user_ids.put(user_id, True)
+        else:
+            user_id = None
+
+    g.current_user_id = user_id
+    return user_id
+
+
+def current_user():
+    """
+    取得目前請求的 User 實例（需要 email、密碼等欄位時才使用），同一個請求只會查詢一次。
+
+    Returns:
+    - User 實例；使用者不存在時返回 None。
+    """
+    if "current_user" in g:
+        return g.current_user
+
+    user_id = current_user_id()
+    user = db.session.get(User, user_id) if user_id is not None else None
+    g.current_user = user
+    return user
+
+
+def forget_user(user):
+    """使用者帳號刪除後，立即從快取移除，不必等到過期"""
+    _existing_user_ids.discard(user.id)
+    _user_ids_by_email.discard(user.email)
+    g.pop("current_user_id", None)
+    g.pop("current_user", None)
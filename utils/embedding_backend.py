@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+
+import torch
+from chromadb import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils import embedding_functions
+from transformers import AutoModel, AutoTokenizer
+
+# default：Chroma 內建（第一次使用時會下載模型）；local：從本機目錄載入
+# 切換後向量維度不同，要先以 python -m utils.reindex_events --drop-collections 重新索引
+backend = os.getenv("EMBEDDING_BACKEND", "default")
+# 本機 sentence-embedding 模型的目錄
+model_dir = os.getenv("EMBEDDING_MODEL_DIR", "../embedding_model")
+batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# 是否以 int8 dynamic quantization 執行 Linear 層
+quantize = os.getenv("EMBEDDING_QUANTIZE", "false").lower() == "true"
+max_length = int(os.getenv("EMBEDDING_MAX_LENGTH", "256"))
+
+
+class LocalEmbeddingFunction(EmbeddingFunction):
+    """
+    從本機目錄載入 sentence-embedding 模型，在 CPU 上批次計算向量。
+
+    只讀取本機檔案，不會連網下載；模型在第一次使用時才載入。
+    向量以 mean pooling 後做 L2 正規化。
+    """
+
+    def __init__(self, model_dir: str = model_dir, batch_size: int = batch_size, quantize: bool = quantize):
+        self.model_dir = model_dir
+        self.batch_size = batch_size
+        self.quantize = quantize
+        self.cache_key = f"local_{os.path.basename(os.path.normpath(model_dir))}"
+        self._model = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is not None:
+                return
+            tokenizer = AutoTokenizer.from_pretrained(self.model_dir, local_files_only=True)
+            model = AutoModel.from_pretrained(self.model_dir, local_files_only=True)
+            model.eval()
+            if self.quantize:
+                model = torch.quantization.quantize_dynamic(
+                    model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+            self._tokenizer = tokenizer
+            self._model = model
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if self._model is None:
+            self._load()
+
+        embeddings = []
+        for start in range(0, len(input), self.batch_size):
+            batch = list(input[start : start + self.batch_size])
+            encoded = self._tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=max_length,
+                return_tensors="pt",
+            )
+            with torch.no_grad():
+                hidden = self._model(**encoded).last_hidden_state
+            mask = encoded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+            embeddings.extend(pooled.tolist())
+        return embeddings
+
+
+_embedding_function = None
+_embedding_function_lock = threading.Lock()
+
+
+def get_embedding_function():
+    """依 EMBEDDING_BACKEND 取得整個 process 共用的 embedding function"""
+    global _embedding_function
+    if _embedding_function is None:
+        with _embedding_function_lock:
+            if _embedding_function is None:
+                if backend == "local":
+                    _embedding_function = LocalEmbeddingFunction()
+                else:
+                    _embedding_function = embedding_functions.DefaultEmbeddingFunction()
+    return _embedding_function
+
+
+def benchmark(documents, embedding_function=None, rounds: int = 3) -> float:
+    """回傳 embedding 的速度（docs/sec），第一次呼叫（含模型載入）不計入"""
+    embedding_function = embedding_function or get_embedding_function()
+    embedding_function(documents[:1])
+    start = time.perf_counter()
+    for _ in range(rounds):
+        embedding_function(documents)
+    return len(documents) * rounds / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    sample = [f"2024-01-{i % 28 + 1:02d}:第{i}次聚會是和大學同學一起去吃火鍋，聊了很多近況" for i in range(256)]
+    print(f"[INFO] Embedding backend: {backend}, quantize: {quantize}, batch size: {batch_size}")
+    print(f"[INFO] {benchmark(sample):.1f} docs/sec")
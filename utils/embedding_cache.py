@@ -0,0 +1,103 @@
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from utils import chroma
+from utils.embedding_backend import get_embedding_function
+
+# 存放「文件 hash -> 向量」的 collection，所有使用者共用
+cache_collection_name = "embedding_cache"
+# 記憶體內最多保留幾個向量
+memory_cache_size = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+
+
+def normalize_document(document: str) -> str:
+    """正規化文件內容：全半形統一、去除頭尾空白、合併連續空白"""
+    document = unicodedata.normalize("NFKC", document)
+    return re.sub(r"\s+", " ", document).strip()
+
+
+def as_vector(embedding):
+    """轉成 Chroma 可接受的 float list（numpy array 也適用）"""
+    return [float(value) for value in embedding]
+
+
+def document_hash(document: str) -> str:
+    """以正規化後的文件內容計算 hash"""
+    return hashlib.sha256(normalize_document(document).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    以文件內容 hash 為 key 的向量快取。
+
+    先查記憶體 LRU，再查 embedding_cache collection，都沒有才呼叫 embedding function，
+    而且只對未命中的文件做一次批次 embedding。
+    """
+
+    def __init__(self, embedding_function=None):
+        self.embedding_function = embedding_function or get_embedding_function()
+        # 不同模型的向量不能混用，各自存放在不同的 collection
+        cache_key = getattr(self.embedding_function, "cache_key", None)
+        self.collection_name = (
+            f"{cache_collection_name}_{cache_key}" if cache_key else cache_collection_name
+        )
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key, embedding):
+        with self._lock:
+            self._memory[key] = embedding
+            self._memory.move_to_end(key)
+            while len(self._memory) > memory_cache_size:
+                self._memory.popitem(last=False)
+
+    def embed(self, documents):
+        """回傳每份文件的向量，順序與 documents 相同"""
+        keys = [document_hash(document) for document in documents]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        collection = chroma.create_collection(self.collection_name)
+        if missing:
+            stored = collection.get(ids=missing, include=["embeddings"])
+            for key, embedding in zip(stored["ids"], stored["embeddings"]):
+                found[key] = as_vector(embedding)
+                self._remember(key, found[key])
+
+        to_embed = [
+            (key, normalize_document(document))
+            for key, document in dict(zip(keys, documents)).items()
+            if key not in found
+        ]
+        if to_embed:
+            embeddings = [
+                as_vector(embedding)
+                for embedding in self.embedding_function(
+                    [document for _, document in to_embed]
+                )
+            ]
+            collection.upsert(
+                ids=[key for key, _ in to_embed],
+                embeddings=embeddings,
+            )
+            for (key, _), embedding in zip(to_embed, embeddings):
+                found[key] = embedding
+                self._remember(key, embedding)
+
+        self.hits += len(keys) - len(to_embed)
+        self.misses += len(to_embed)
+        return [found[key] for key in keys]
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,54 @@
+import hashlib
+from datetime import timezone
+
+from flask import make_response, request
+
+
+def to_utc(value):
+    """資料庫時間轉成 UTC；SQLite 取回的時間不含時區，視為 UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def make_etag(*parts):
+    """以組成內容的版本資訊計算 ETag（不需要先序列化回應內容）"""
+    raw = "|".join(str(part) for part in parts)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def is_not_modified(etag, last_modified=None):
+    """
+    判斷請求的 If-None-Match / If-Modified-Since 是否與目前的版本相符。
+
+    有 If-None-Match 時只比較 ETag，忽略 If-Modified-Since（RFC 9110）。
+
+    Parameters:
+    - etag (str): 目前的 ETag。
+    - last_modified (datetime): 目前的最後修改時間。
+
+    Returns:
+    - bool: 客戶端的快取仍然有效時返回 True。
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        # Last-Modified 標頭只精確到秒
+        return to_utc(last_modified).replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def set_validators(response, etag, last_modified=None):
+    """設定 ETag、Last-Modified，並要求客戶端每次使用快取前都先驗證"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = to_utc(last_modified)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def not_modified_response(etag, last_modified=None):
+    """304 回應，仍然帶上驗證用的標頭"""
+    return set_validators(make_response("", 304), etag, last_modified)
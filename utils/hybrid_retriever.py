@@ -0,0 +1,221 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from datetime import date, timedelta
+
+# 向量分數所佔的權重，其餘為 BM25
+hybrid_alpha = float(os.getenv("RAG_HYBRID_ALPHA", "0.6"))
+# 最多保留幾個使用者的 BM25 索引
+index_cache_size = int(os.getenv("BM25_INDEX_CACHE_SIZE", "256"))
+
+CHINESE_NUMERALS = {
+    "一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6,
+    "七": 7, "八": 8, "九": 9, "十": 10, "十一": 11, "十二": 12,
+}
+
+
+def _parse_month(value: str) -> int | None:
+    if value.isdigit():
+        month = int(value)
+    else:
+        month = CHINESE_NUMERALS.get(value)
+    if month is None or not 1 <= month <= 12:
+        return None
+    return month
+
+
+def _month_range(year: int, month: int):
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def extract_date_range(text: str, today: date | None = None):
+    """
+    從輸入文字中抽出日期描述，轉成半開區間 [start, end)。
+
+    支援：今年/去年/前年、YYYY年、M月（含中文數字）、上個月/這個月、上週/這週、今天/昨天/前天。
+
+    Returns:
+    - (start, end) 的 date tuple；沒有日期描述時回傳 None。
+    """
+    today = today or date.today()
+
+    if "前天" in text:
+        day = today - timedelta(days=2)
+        return day, day + timedelta(days=1)
+    if "昨天" in text:
+        day = today - timedelta(days=1)
+        return day, day + timedelta(days=1)
+    if "今天" in text:
+        return today, today + timedelta(days=1)
+
+    this_monday = today - timedelta(days=today.weekday())
+    if re.search(r"上(個)?(週|周|星期|禮拜)", text):
+        return this_monday - timedelta(days=7), this_monday
+    if re.search(r"(這|本)(個)?(週|周|星期|禮拜)", text):
+        return this_monday, this_monday + timedelta(days=7)
+
+    if re.search(r"上(個)?月", text):
+        year, month = (today.year - 1, 12) if today.month == 1 else (today.year, today.month - 1)
+        return _month_range(year, month)
+    if re.search(r"(這|本)(個)?月", text):
+        return _month_range(today.year, today.month)
+
+    year = None
+    match = re.search(r"(\d{4})\s*年", text)
+    if match:
+        year = int(match.group(1))
+    elif "前年" in text:
+        year = today.year - 2
+    elif "去年" in text:
+        year = today.year - 1
+    elif "今年" in text:
+        year = today.year
+
+    month = None
+    match = re.search(r"(\d{1,2}|十[一二]?|[一二三四五六七八九])\s*月", text)
+    if match:
+        month = _parse_month(match.group(1))
+
+    if month is not None:
+        if year is None:
+            # 沒說哪一年時，指的是最近一次的該月份
+            year = today.year if month <= today.month else today.year - 1
+        return _month_range(year, month)
+    if year is not None:
+        return date(year, 1, 1), date(year + 1, 1, 1)
+    return None
+
+
+def date_to_day(value: date) -> int:
+    """日期轉成 YYYYMMDD 整數，作為可比較大小的 metadata"""
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def date_range_where(date_range):
+    """把日期區間轉成 Chroma 的 where 條件"""
+    if date_range is None:
+        return None
+    start, end = date_range
+    return {
+        "$and": [
+            {"event_day": {"$gte": date_to_day(start)}},
+            {"event_day": {"$lt": date_to_day(end)}},
+        ]
+    }
+
+
+def bigrams(text: str):
+    """中文以字元 bigram 切詞；英數字以整個詞為單位"""
+    tokens = []
+    for chunk in re.findall(r"[一-鿿]+|[A-Za-z0-9]+", text.lower()):
+        if re.match(r"[A-Za-z0-9]", chunk):
+            tokens.append(chunk)
+        elif len(chunk) == 1:
+            tokens.append(chunk)
+        else:
+            tokens.extend(chunk[i : i + 2] for i in range(len(chunk) - 1))
+    return tokens
+
+
+class BM25Index:
+    """預先計算好的字元 bigram BM25 索引"""
+
+    def __init__(self, ids, documents, metadatas, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = list(ids)
+        self.documents = dict(zip(self.ids, documents))
+        self.days = {
+            id: (metadata or {}).get("event_day") for id, metadata in zip(self.ids, metadatas)
+        }
+        self.term_freqs = {id: Counter(bigrams(doc or "")) for id, doc in self.documents.items()}
+        self.lengths = {id: sum(tf.values()) for id, tf in self.term_freqs.items()}
+        self.avg_length = (sum(self.lengths.values()) / len(self.ids)) if self.ids else 0
+        doc_freqs = Counter()
+        for tf in self.term_freqs.values():
+            doc_freqs.update(tf.keys())
+        n = len(self.ids)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()
+        }
+
+    def search(self, query: str, date_range=None):
+        """回傳 {id: score}，只包含分數大於 0 且在日期區間內的文件"""
+        terms = [term for term in set(bigrams(query)) if term in self.idf]
+        if not terms:
+            return {}
+        if date_range is not None:
+            start, end = date_to_day(date_range[0]), date_to_day(date_range[1])
+        scores = {}
+        for id, tf in self.term_freqs.items():
+            if date_range is not None:
+                day = self.days.get(id)
+                if day is None or not start <= day < end:
+                    continue
+            length_norm = self.k1 * (1 - self.b + self.b * self.lengths[id] / (self.avg_length or 1))
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + length_norm)
+            if score > 0:
+                scores[id] = score
+        return scores
+
+
+# user_id -> 版本號；寫入向量資料庫後遞增，BM25 索引就會重建
+_versions = Counter()
+# user_id -> (版本號, BM25Index)
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def invalidate(user_id):
+    """使用者的向量資料變動時呼叫，讓 BM25 索引在下次查詢時重建"""
+    with _lock:
+        _versions[user_id] += 1
+        _indexes.pop(user_id, None)
+
+
+def get_bm25_index(user_id, collection, where=None) -> BM25Index:
+    with _lock:
+        version = _versions[user_id]
+        cached = _indexes.get(user_id)
+        if cached is not None and cached[0] == version:
+            _indexes.move_to_end(user_id)
+            return cached[1]
+
+    results = collection.get(where=where, include=["documents", "metadatas"])
+    index = BM25Index(results["ids"], results["documents"], results["metadatas"])
+    with _lock:
+        _indexes[user_id] = (version, index)
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > index_cache_size:
+            _indexes.popitem(last=False)
+    return index
+
+
+def combine_scores(vector_hits, bm25_scores, alpha: float = hybrid_alpha):
+    """
+    合併向量檢索和 BM25 的分數，兩者各自正規化到 0~1 後加權。
+
+    Parameters:
+    - vector_hits (dict): {id: distance}。
+    - bm25_scores (dict): {id: score}。
+
+    Returns:
+    - list: 依分數排序的 (id, score)。
+    """
+    vector_scores = {id: 1 / (1 + distance) for id, distance in vector_hits.items()}
+    max_vector = max(vector_scores.values(), default=0) or 1
+    max_bm25 = max(bm25_scores.values(), default=0) or 1
+    combined = {
+        id: alpha * vector_scores.get(id, 0) / max_vector
+        + (1 - alpha) * bm25_scores.get(id, 0) / max_bm25
+        for id in set(vector_scores) | set(bm25_scores)
+    }
+    return sorted(combined.items(), key=lambda item: item[1], reverse=True)
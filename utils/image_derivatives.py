@@ -0,0 +1,143 @@
+import logging
+import os
+import queue
+import threading
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 沒有安裝 Pillow 時一律回傳原圖
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# 縮圖尺寸名稱 -> 最長邊的像素
+SIZES = {
+    "small": 96,
+    "medium": 320,
+    "large": 1024,
+}
+# WebP 壓縮品質
+webp_quality = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+# 縮圖放在原圖所在資料夾下的這個子資料夾
+DERIVATIVE_DIRECTORY = "derivatives"
+
+SOURCE_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG"}
+
+
+def derivative_path(source_path, size, webp=False):
+    """
+    縮圖的檔案路徑，例如 user_photo_file/5/derivatives/avatar.png.small.webp。
+
+    Parameters:
+    - source_path (str): 原圖路徑。
+    - size (str): SIZES 中的尺寸名稱。
+    - webp (bool): 是否為 WebP 版本；否則與原圖格式相同。
+    """
+    folder, filename = os.path.split(source_path)
+    name = f"{filename}.{size}"
+    if webp:
+        name += ".webp"
+    else:
+        name += os.path.splitext(filename)[1].lower()
+    return os.path.join(folder, DERIVATIVE_DIRECTORY, name)
+
+
+def _save(image, path, format, **params):
+    # 先寫到暫存檔再改名，避免讀到寫到一半的檔案
+    tmp_path = f"{path}.tmp"
+    image.save(tmp_path, format=format, **params)
+    os.replace(tmp_path, path)
+
+
+def generate_derivatives(source_path):
+    """產生原圖的所有尺寸（原格式與 WebP 各一份）"""
+    source_format = SOURCE_FORMATS.get(os.path.splitext(source_path)[1].lower())
+    if source_format is None:
+        return
+    os.makedirs(os.path.join(os.path.dirname(source_path), DERIVATIVE_DIRECTORY), exist_ok=True)
+
+    with Image.open(source_path) as image:
+        # 依照 EXIF 轉正手機拍的照片
+        image = ImageOps.exif_transpose(image)
+        if source_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        for size, pixels in SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((pixels, pixels), Image.LANCZOS)
+            _save(resized, derivative_path(source_path, size, webp=True), "WEBP", quality=webp_quality, method=4)
+            if source_format == "JPEG":
+                _save(resized, derivative_path(source_path, size), "JPEG", quality=85, optimize=True, progressive=True)
+            else:
+                _save(resized, derivative_path(source_path, size), "PNG", optimize=True)
+
+
+def delete_derivatives(source_path):
+    """原圖被刪除或覆蓋時，一併刪除所有縮圖"""
+    image_worker.forget(source_path)
+    for size in SIZES:
+        for webp in (False, True):
+            path = derivative_path(source_path, size, webp)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def find_derivative(source_path, size, webp=False):
+    """
+    取得已產生的縮圖路徑。
+
+    Returns:
+    - str: 縮圖路徑；尚未產生時回傳 None（呼叫端應回傳原圖並排入產生）。
+    """
+    if size not in SIZES:
+        return None
+    path = derivative_path(source_path, size, webp)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path):
+        return path
+    return None
+
+
+class ImageWorker:
+    """
+    在背景 thread 產生縮圖，上傳的 request 不需要等待圖片處理。
+
+    同一張圖片排隊中時不會重複排入；處理失敗的圖片（例如檔案損毀）不會再排入。
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._failed = set()
+        if Image is not None:
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def enqueue(self, source_path):
+        """排入產生縮圖；沒有安裝 Pillow 時不做任何事"""
+        if Image is None:
+            return
+        with self._lock:
+            if source_path in self._pending or source_path in self._failed:
+                return
+            self._pending.add(source_path)
+        self._queue.put(source_path)
+
+    def forget(self, source_path):
+        """同名的新圖片上傳後可以重新處理"""
+        with self._lock:
+            self._failed.discard(source_path)
+
+    def _worker(self):
+        while True:
+            source_path = self._queue.get()
+            with self._lock:
+                self._pending.discard(source_path)
+            try:
+                if os.path.exists(source_path):
+                    generate_derivatives(source_path)
+            except Exception as e:
+                logger.error(f"Error generating derivatives for {source_path}: {e}")
+                with self._lock:
+                    self._failed.add(source_path)
+
+
+image_worker = ImageWorker()
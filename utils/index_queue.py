@@ -0,0 +1,236 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from extensions import db
+from repository.event_index_outbox_repo import EventIndexOutboxRepository
+from repository.event_journal_repo import EventJournalRepository
+from utils import chroma, hybrid_retriever
+from utils.embedding_cache import document_hash, embedding_cache
+from utils.retrieval_cache import retrieval_cache
+
+logger = logging.getLogger(__name__)
+
+# 每批最多處理幾筆操作
+batch_size = int(os.getenv("INDEX_QUEUE_BATCH_SIZE", "64"))
+# 收集一批操作時最多等待的秒數
+batch_wait = float(os.getenv("INDEX_QUEUE_BATCH_WAIT", "0.2"))
+# 寫入失敗時的重試次數
+max_retries = int(os.getenv("INDEX_QUEUE_MAX_RETRIES", "5"))
+# 重試次數用完仍失敗的事件，每隔幾秒再重新排入一次
+retry_failed_interval = float(os.getenv("INDEX_QUEUE_RETRY_FAILED_INTERVAL", "600"))
+
+PENDING = "pending"
+INDEXED = "indexed"
+FAILED = "failed"
+
+
+def format_event_date(event_date):
+    """事件日期統一成 YYYY-MM-DD，讓同樣的內容產生同樣的文件"""
+    if isinstance(event_date, datetime):
+        return event_date.date().isoformat()
+    return str(event_date)
+
+
+def event_document(event_date, event_title, event_content):
+    """組成寫入向量資料庫的文件內容"""
+    return f"{event_date}:{event_title}是{event_content}"
+
+
+def index_entry(event):
+    """以資料庫中的事件內容組成向量資料庫的一筆資料"""
+    event_date = format_event_date(event.event_date)
+    metadata = {"user_id": event.user_id, "event_title": event.event_title, "event_date": event_date}
+    if isinstance(event.event_date, datetime):
+        # 日期過濾用的整數欄位（YYYYMMDD）
+        metadata["event_day"] = hybrid_retriever.date_to_day(event.event_date.date())
+    return {
+        "user_id": event.user_id,
+        "event_id": str(event.id),
+        "document": event_document(event_date, event.event_title, event.event_content),
+        "metadata": metadata,
+    }
+
+
+class IndexQueue:
+    """
+    事件日誌的向量索引寫入佇列（write-behind）。
+
+    事件的異動會在同一個交易中寫入 event_index_outbox，request thread 只需要再通知佇列
+    就可以回應使用者。背景 thread 依使用者分組，從資料庫讀取事件最新的內容，
+    合併成單次的 upsert / delete 呼叫，成功後才刪除 outbox 紀錄；失敗時以指數退避重試，
+    重試次數用完則標記失敗，定期重新排入。重新啟動時會排入所有還沒同步的事件。
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._app = None
+
+    def init_app(self, app):
+        """啟動背景 thread（需要在 schema migration 之後），並排入上次停止前還沒同步的事件"""
+        self._app = app
+        with app.app_context():
+            pending = EventIndexOutboxRepository.get_pending()
+        for user_id, event_id in pending:
+            self.enqueue(user_id, event_id)
+        if pending:
+            logger.info(f"Re-queued {len(pending)} events that were not indexed before shutdown")
+        threading.Thread(target=self._worker, daemon=True).start()
+        threading.Thread(target=self._retry_failed_worker, daemon=True).start()
+
+    def enqueue(self, user_id, event_id):
+        """通知背景 thread 同步事件（outbox 紀錄已由 repository 和事件一起 commit）"""
+        retrieval_cache.bump(user_id)
+        self._queue.put({"user_id": user_id, "event_id": int(event_id), "attempt": 0})
+
+    def get_status(self, event_id) -> str:
+        """依 outbox 紀錄取得事件的索引狀態：沒有紀錄代表已經同步完成"""
+        flags = EventIndexOutboxRepository.get_failed_flags(event_id)
+        if not flags:
+            return INDEXED
+        return FAILED if all(flags) else PENDING
+
+    def _retry_failed_worker(self):
+        while True:
+            time.sleep(retry_failed_interval)
+            try:
+                with self._app.app_context():
+                    failed = EventIndexOutboxRepository.retry_failed()
+                for user_id, event_id in failed:
+                    self.enqueue(user_id, event_id)
+                if failed:
+                    logger.info(f"Retrying {len(failed)} events that failed to index")
+            except Exception as e:
+                logger.error(f"Error retrying failed index operations: {e}")
+
+    def _drain(self):
+        items = [self._queue.get()]
+        deadline = time.monotonic() + batch_wait
+        while len(items) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _worker(self):
+        while True:
+            items = self._drain()
+            try:
+                self._process(items)
+            except Exception as e:
+                logger.error(f"Error in index queue worker: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    def _process(self, items):
+        # 依使用者分組，同一個事件只處理一次
+        grouped = defaultdict(dict)
+        for item in items:
+            ops = grouped[item["user_id"]]
+            ops[item["event_id"]] = max(ops.get(item["event_id"], 0), item["attempt"])
+
+        with self._app.app_context():
+            for user_id, attempts in grouped.items():
+                try:
+                    self._sync_user(user_id, attempts)
+                except Exception as e:
+                    logger.error(f"Error indexing events for user {user_id}: {e}")
+                    db.session.rollback()
+                    self._retry(user_id, attempts)
+
+    def _sync_user(self, user_id, attempts):
+        # 先記下目前最新的 outbox 紀錄，再讀取事件內容；之後才 commit 的異動會留下新的紀錄
+        latest_ids = EventIndexOutboxRepository.latest_ids(list(attempts))
+        if not latest_ids:
+            # 已經由較早的通知同步完成
+            return
+        events = EventJournalRepository.get_events_by_ids(user_id, list(latest_ids))
+        upserts = [index_entry(event) for event in events]
+        # 已經不存在的事件要從向量資料庫刪除
+        existing = {event.id for event in events}
+        deletes = [str(event_id) for event_id in latest_ids if event_id not in existing]
+        try:
+            with chroma.write_lock:
+                for collection in chroma.user_write_targets(user_id):
+                    if upserts:
+                        self._upsert(collection, upserts)
+                    if deletes:
+                        chroma.delete_documents(collection=collection, ids=deletes)
+        finally:
+            hybrid_retriever.invalidate(user_id)
+            # 寫入完成後再讓快取失效一次，避免寫入期間快取到舊的結果
+            retrieval_cache.bump(user_id)
+        EventIndexOutboxRepository.complete(latest_ids)
+
+    def _upsert(self, collection, upserts):
+        # 文件內容沒變的只更新 metadata，其餘的向量從 embedding cache 取得
+        existing = chroma.get_metadatas(
+            collection, [item["event_id"] for item in upserts]
+        )
+        unchanged = []
+        changed = []
+        for item in upserts:
+            doc_hash = document_hash(item["document"])
+            # sharded 配置以 user_id metadata 區分使用者，一定要帶上
+            item["metadata"] = {
+                **item["metadata"],
+                "user_id": item["user_id"],
+                "doc_hash": doc_hash,
+            }
+            stored = existing.get(item["event_id"]) or {}
+            if stored.get("doc_hash") == doc_hash:
+                unchanged.append(item)
+            else:
+                changed.append(item)
+
+        if unchanged:
+            chroma.update_metadatas(
+                collection=collection,
+                ids=[item["event_id"] for item in unchanged],
+                metadatas=[item["metadata"] for item in unchanged],
+            )
+        if changed:
+            chroma.upsert_documents(
+                collection=collection,
+                ids=[item["event_id"] for item in changed],
+                documents=[item["document"] for item in changed],
+                metadatas=[item["metadata"] for item in changed],
+                embeddings=embedding_cache.embed(
+                    [item["document"] for item in changed]
+                ),
+            )
+
+    def _retry(self, user_id, attempts):
+        retry_items = []
+        given_up = []
+        for event_id, attempt in attempts.items():
+            if attempt + 1 > max_retries:
+                given_up.append(event_id)
+            else:
+                retry_items.append({"user_id": user_id, "event_id": event_id, "attempt": attempt + 1})
+
+        if given_up:
+            logger.error(f"Giving up indexing events {given_up} after {max_retries} retries")
+            try:
+                EventIndexOutboxRepository.mark_failed(EventIndexOutboxRepository.latest_ids(given_up))
+            except Exception as e:
+                # 沒有標記成功時紀錄仍是 pending，重新啟動後會再排入
+                logger.error(f"Error marking events {given_up} as failed: {e}")
+
+        for item in retry_items:
+            delay = min(30, 2 ** item["attempt"])
+            timer = threading.Timer(delay, self._queue.put, args=(item,))
+            timer.daemon = True
+            timer.start()
+
+
+index_queue = IndexQueue()
@@ -0,0 +1,288 @@
+"""
+以 EXPLAIN 檢查每個 repository 查詢是否使用索引。
+
+在一個灌好測試資料的資料庫上實際呼叫 repository 的查詢方法，記錄送出的 SELECT，
+再對每一條執行 EXPLAIN；出現整張表掃描（SQLite 的 SCAN、PostgreSQL 的 Seq Scan）就視為失敗。
+
+    python -m utils.query_plan_check                      # SQLite in-memory
+    python -m utils.query_plan_check --database-url postgresql://.../scratch
+
+會寫入測試資料，只能指向可以丟棄的資料庫。
+"""
+import argparse
+import json
+import logging
+import sys
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask
+from sqlalchemy import event, insert, text
+
+from extensions import db
+from models.event_journal import EventJournal
+from models.event_journal_version import EventJournalVersion
+from models.event_timeline import EventTimeline
+from models.password_verification_code import PasswordVerificationCode
+from models.shared_model import SharedModel
+from models.trained_model import TrainedModel
+from models.training_file import TrainingFile
+from models.user import RefreshToken, User
+from models.user_photo import UserPhoto
+from repository.event_index_outbox_repo import EventIndexOutboxRepository
+from repository.event_journal_repo import EventJournalRepository
+from repository.event_journal_version_repo import EventJournalVersionRepository
+from repository.event_search_repo import EventSearchRepository
+from repository.event_timeline_repo import EventTimelineRepository, month_of
+from repository.password_verification_repo import PasswordVerificationCodeRepo
+from repository.shared_model_repo import SharedModelRepo
+from repository.trainedmodel_repo import TrainedModelRepo
+from repository.trainingfile_repo import TrainingFileRepo
+from repository.userphoto_repo import UserPhotoRepo
+from utils.schema_migrations import migrate
+
+logger = logging.getLogger(__name__)
+
+EVENT_START_DATE = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def create_app(database_url):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    return app
+
+
+def seed(user_count, events_per_user):
+    """以批次 insert 灌入測試資料，每個使用者都有模型、訓練檔、分享連結、token 與事件"""
+    users, photos, tokens, codes = [], [], [], []
+    models, files, shares, events = [], [], [], []
+    timeline = {}
+    for user_id in range(1, user_count + 1):
+        email = f"user{user_id}@example.com"
+        users.append(
+            {"id": user_id, "lastname": "測試", "firstname": str(user_id), "email": email, "password": "x"}
+        )
+        photos.append({"id": user_id, "user_id": user_id, "photoname": "avatar.png"})
+        tokens.append({"id": user_id, "user_id": user_id, "token": f"refresh-token-{user_id}", "revoked": False})
+        codes.append({"id": user_id, "email": email, "verification_code": "123456"})
+        for n in range(2):
+            model_id = user_id * 2 - 1 + n
+            models.append(
+                {
+                    "id": model_id,
+                    "user_id": user_id,
+                    "modelname": f"model-{model_id}",
+                    "model_original_name": f"模型 {n}",
+                    "start_time": EVENT_START_DATE,
+                }
+            )
+            files.append(
+                {
+                    "id": model_id,
+                    "user_id": user_id,
+                    "model_id": model_id,
+                    "filename": f"file-{model_id}.csv",
+                    "original_file_name": "chat.txt",
+                    "error_msg": "",
+                }
+            )
+        # 每個使用者分享一個模型給下一個使用者
+        shares.append(
+            {
+                "id": user_id,
+                "model_id": user_id * 2 - 1,
+                "acquirer_id": user_id % user_count + 1,
+                "link": f"link-{user_id}",
+            }
+        )
+        for n in range(events_per_user):
+            event_date = EVENT_START_DATE + timedelta(days=n * 7)
+            events.append(
+                {
+                    "id": (user_id - 1) * events_per_user + n + 1,
+                    "user_id": user_id,
+                    "event_title": f"生日聚會 {n}",
+                    "event_content": f"和家人一起吃晚餐 {user_id}-{n}",
+                    "event_date": event_date,
+                    "event_picture": "",
+                }
+            )
+            key = (user_id, *month_of(event_date))
+            timeline[key] = timeline.get(key, 0) + 1
+
+    for model, rows in [
+        (User, users),
+        (UserPhoto, photos),
+        (RefreshToken, tokens),
+        (PasswordVerificationCode, codes),
+        (TrainedModel, models),
+        (TrainingFile, files),
+        (SharedModel, shares),
+        (EventJournal, events),
+        (
+            EventJournalVersion,
+            [{"user_id": user_id, "changed_at": EVENT_START_DATE} for user_id in range(1, user_count + 1)],
+        ),
+        (
+            EventTimeline,
+            [
+                {"user_id": user_id, "year": year, "month": month, "event_count": count}
+                for (user_id, year, month), count in timeline.items()
+            ],
+        ),
+    ]:
+        if rows:
+            db.session.execute(insert(model), rows)
+    db.session.commit()
+    # 更新統計資訊，讓 planner 依照實際的資料量選擇執行計畫
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+
+
+def repository_queries(user_count, events_per_user):
+    """(名稱, 呼叫) 列表；只包含唯讀的查詢"""
+    user_id = user_count // 2 or 1
+    email = f"user{user_id}@example.com"
+    model_id = user_id * 2 - 1
+    start, end = EventJournalRepository.date_range_of(EVENT_START_DATE.year)
+    first_event_id = (user_id - 1) * events_per_user + 1
+    return [
+        ("User.get_user_by_email", lambda: User.get_user_by_email(email)),
+        ("User.is_user_id_exists", lambda: User.is_user_id_exists(user_id)),
+        ("RefreshToken.find_by_token_and_user", lambda: RefreshToken.find_by_token_and_user(f"refresh-token-{user_id}", user_id)),
+        ("RefreshToken.find_by_userId", lambda: RefreshToken.find_by_userId(user_id)),
+        ("PasswordVerificationCodeRepo.find_password_verification_code_by_email",
+         lambda: PasswordVerificationCodeRepo.find_password_verification_code_by_email(email)),
+        ("UserPhotoRepo.find_user_photo_by_user_id", lambda: UserPhotoRepo.find_user_photo_by_user_id(user_id)),
+        ("TrainedModelRepo.find_trainedmodel_by_user_and_modelname",
+         lambda: TrainedModelRepo.find_trainedmodel_by_user_and_modelname(user_id, f"model-{model_id}")),
+        ("TrainedModelRepo.find_trainedmodel_by_user_and_model_id",
+         lambda: TrainedModelRepo.find_trainedmodel_by_user_and_model_id(user_id, model_id)),
+        ("TrainedModelRepo.find_all_trainedmodel_by_user_id", lambda: TrainedModelRepo.find_all_trainedmodel_by_user_id(user_id)),
+        ("TrainingFileRepo.find_first_training_file_by_user_and_model_id",
+         lambda: TrainingFileRepo.find_first_training_file_by_user_and_model_id(user_id, model_id)),
+        ("TrainingFileRepo.find_training_file_by_user_and_model_id",
+         lambda: TrainingFileRepo.find_training_file_by_user_and_model_id(user_id, model_id)),
+        ("TrainingFileRepo.find_trainingfile_by_user_id", lambda: TrainingFileRepo.find_trainingfile_by_user_id(user_id)),
+        # 連結已經被取走，只會查詢不會寫入
+        ("SharedModelRepo.obtain_shared_model", lambda: SharedModelRepo.obtain_shared_model(f"link-{user_id}", user_id)),
+        ("SharedModelRepo.find_sharedmodels_by_acquirer_id", lambda: SharedModelRepo.find_sharedmodels_by_acquirer_id(user_id)),
+        ("SharedModelRepo.find_trainedmodel_by_modelname_and_acquirer_id",
+         lambda: SharedModelRepo.find_trainedmodel_by_modelname_and_acquirer_id(f"model-{model_id - 2}", user_id)),
+        ("EventJournalRepository.get_events_page", lambda: EventJournalRepository.get_events_page(user_id, 50)),
+        ("EventJournalRepository.get_events_page(after)",
+         lambda: EventJournalRepository.get_events_page(user_id, 50, after=(EVENT_START_DATE, first_event_id))),
+        ("EventJournalRepository.get_events_by_date_range",
+         lambda: EventJournalRepository.get_events_by_date_range(user_id, start, end)),
+        ("EventJournalVersionRepository.get_changed_at", lambda: EventJournalVersionRepository.get_changed_at(user_id)),
+        ("EventJournalRepository.get_events_by_ids",
+         lambda: EventJournalRepository.get_events_by_ids(user_id, [first_event_id, first_event_id + 1])),
+        ("EventIndexOutboxRepository.get_failed_flags", lambda: EventIndexOutboxRepository.get_failed_flags(first_event_id)),
+        ("EventTimelineRepository.get_timeline", lambda: EventTimelineRepository.get_timeline(user_id)),
+        ("EventSearchRepository.search", lambda: EventSearchRepository.search(user_id, "生日聚會", 20)),
+        ("EventSearchRepository.search(short)", lambda: EventSearchRepository.search(user_id, "生日", 20)),
+    ]
+
+
+def capture_selects(call):
+    """執行 call，回傳過程中送出的 SELECT 與參數"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        call()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def explain(statement, parameters):
+    """
+    回傳 (執行計畫的每一行, 整張表掃描的表名列表)。
+
+    PostgreSQL 關閉 enable_seqscan，只要有可用的索引就會使用，結果不受測試資料量影響。
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        lines, scans = [], []
+
+        def walk(node, depth):
+            relation = node.get("Relation Name")
+            lines.append("  " * depth + node["Node Type"] + (f" on {relation}" if relation else ""))
+            if node["Node Type"] == "Seq Scan":
+                scans.append(relation)
+            for child in node.get("Plans", []):
+                walk(child, depth + 1)
+
+        walk(plan[0]["Plan"], 0)
+        return lines, scans
+
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    lines = [row[-1] for row in rows]
+    # SQLite：「SCAN 表名」是整張表掃描；使用索引時是「SEARCH ... USING INDEX」或「SCAN ... USING COVERING INDEX」
+    scans = [
+        line.split()[1]
+        for line in lines
+        if line.startswith("SCAN ") and "INDEX" not in line and "VIRTUAL TABLE" not in line
+    ]
+    return lines, scans
+
+
+def check(user_count, events_per_user):
+    """
+    對每個 repository 查詢執行 EXPLAIN。
+
+    Returns:
+    - int: 有整張表掃描的查詢數量。
+    """
+    failures = 0
+    for name, call in repository_queries(user_count, events_per_user):
+        statements = capture_selects(call)
+        if not statements:
+            print(f"?    {name}: no SELECT captured")
+            continue
+        for statement, parameters in statements:
+            lines, scans = explain(statement, parameters)
+            db.session.rollback()
+            status = "SCAN" if scans else "OK"
+            print(f"{status:<4} {name}" + (f" (full scan: {', '.join(scans)})" if scans else ""))
+            for line in lines:
+                print(f"       {line}")
+            failures += bool(scans)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run EXPLAIN on every repository query against a seeded database.")
+    parser.add_argument("--database-url", default="sqlite://", help="可以丟棄的資料庫，預設為 SQLite in-memory")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--events-per-user", type=int, default=50)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    app = create_app(args.database_url)
+    # 和正式環境一樣以 migration 建立表與索引
+    migrate(app)
+    with app.app_context():
+        logger.info(f"Seeding {args.users} users with {args.events_per_user} events each")
+        seed(args.users, args.events_per_user)
+        failures = check(args.users, args.events_per_user)
+    if failures:
+        logger.error(f"{failures} queries scan a whole table")
+        return 1
+    logger.info("All repository queries use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+重新索引所有事件（server 停止時執行）。
+
+把每個事件排入 event_index_outbox，下次啟動 server 時由 index queue 依資料庫的內容重新寫入向量資料庫。
+切換 EMBEDDING_BACKEND 時，既有的向量維度和新的模型不同，要加上 --drop-collections
+先刪除事件的 collection，讓所有事件以新的模型重新 embedding：
+
+    python -m utils.reindex_events                      # 只重寫 metadata（內容沒變的不會重新 embedding）
+    python -m utils.reindex_events --drop-collections   # 切換 embedding 模型後
+"""
+import argparse
+import logging
+import re
+
+from dotenv import load_dotenv
+from flask import Flask
+
+from extensions import db
+from repository.event_index_outbox_repo import EventIndexOutboxRepository
+from utils import chroma
+
+logger = logging.getLogger(__name__)
+
+# 存放事件的 collection（per_user 與 sharded 兩種配置）；embedding cache 的 collection 不包含在內
+EVENT_COLLECTION_PATTERN = re.compile(r"^(collection_\d+|events_shard_\d+)$")
+
+
+def create_app():
+    """和 main.py 相同的資料庫設定，但不啟動背景 thread"""
+    load_dotenv()
+    app = Flask(__name__)
+    app.config.from_prefixed_env()
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    return app
+
+
+def drop_event_collections():
+    """刪除所有存放事件的 collection，回傳刪除的名稱"""
+    client = chroma.init_db_client()
+    names = [getattr(collection, "name", collection) for collection in client.list_collections()]
+    dropped = [name for name in names if EVENT_COLLECTION_PATTERN.match(name)]
+    with chroma.write_lock:
+        for name in dropped:
+            client.delete_collection(name)
+            chroma.evict_collection(name)
+    return dropped
+
+
+def reindex(app, drop_collections=False):
+    """
+    排入所有事件的重新索引。
+
+    Returns:
+    - int: 排入的事件數。
+    """
+    if drop_collections:
+        dropped = drop_event_collections()
+        logger.info(f"Dropped {len(dropped)} event collections")
+    with app.app_context():
+        return EventIndexOutboxRepository.record_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Queue every event to be re-indexed on the next server start.")
+    parser.add_argument(
+        "--drop-collections",
+        action="store_true",
+        help="先刪除事件的 collection，以目前的 EMBEDDING_BACKEND 重新 embedding",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    count = reindex(create_app(), args.drop_collections)
+    logger.info(f"Queued {count} events. Start the server to re-index them.")
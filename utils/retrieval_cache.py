@@ -0,0 +1,112 @@
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 每個使用者最多快取幾個查詢
+entries_per_user = int(os.getenv("RETRIEVAL_CACHE_ENTRIES_PER_USER", "32"))
+# 最多快取幾個使用者
+max_users = int(os.getenv("RETRIEVAL_CACHE_MAX_USERS", "1024"))
+# 快取存活秒數
+ttl_seconds = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+# 每幾次查詢記錄一次命中率
+log_every = 100
+
+
+def normalize_query(query: str) -> str:
+    """全半形統一、轉小寫、合併連續空白"""
+    query = unicodedata.normalize("NFKC", query).lower()
+    return re.sub(r"\s+", " ", query).strip()
+
+
+class RetrievalCache:
+    """
+    每個使用者的檢索結果 LRU 快取：(正規化查詢, n_results) -> 結果。
+
+    事件新增、更新、刪除時呼叫 bump() 遞增該使用者的版本號，
+    版本號不同或超過 TTL 的快取都視為失效。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = Counter()
+        # user_id -> OrderedDict[(query, n_results)] -> (version, expires_at, value)
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, query, n_results):
+        key = (normalize_query(query), n_results)
+        now = time.monotonic()
+        with self._lock:
+            user_entries = self._entries.get(user_id)
+            entry = user_entries.get(key) if user_entries is not None else None
+            if (
+                entry is not None
+                and entry[0] == self._versions[user_id]
+                and entry[1] > now
+            ):
+                self.hits += 1
+                self._entries.move_to_end(user_id)
+                user_entries.move_to_end(key)
+                value = entry[2]
+            else:
+                self.misses += 1
+                if entry is not None:
+                    del user_entries[key]
+                value = None
+            lookups = self.hits + self.misses
+
+        if lookups % log_every == 0:
+            logger.info(f"Retrieval cache stats: {self.stats()}")
+        return value
+
+    def version(self, user_id) -> int:
+        """目前的版本號，查詢前先取得，寫入快取時帶入"""
+        with self._lock:
+            return self._versions[user_id]
+
+    def put(self, user_id, query, n_results, value, version=None):
+        key = (normalize_query(query), n_results)
+        with self._lock:
+            if version is None:
+                version = self._versions[user_id]
+            elif version != self._versions[user_id]:
+                # 查詢期間資料有變動，結果可能是舊的
+                return
+            user_entries = self._entries.setdefault(user_id, OrderedDict())
+            self._entries.move_to_end(user_id)
+            user_entries[key] = (
+                version,
+                time.monotonic() + ttl_seconds,
+                value,
+            )
+            user_entries.move_to_end(key)
+            while len(user_entries) > entries_per_user:
+                user_entries.popitem(last=False)
+            while len(self._entries) > max_users:
+                self._entries.popitem(last=False)
+
+    def bump(self, user_id):
+        """使用者的事件有變動，讓該使用者的快取失效"""
+        with self._lock:
+            self._versions[user_id] += 1
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "users": len(self._entries),
+            }
+
+
+retrieval_cache = RetrievalCache()
@@ -0,0 +1,104 @@
+import importlib
+import logging
+import os
+import pkgutil
+import re
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, select, text
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# migration 腳本的目錄，檔名格式為 vNNN_說明.py，每個腳本提供 upgrade(connection)
+MIGRATIONS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+MIGRATION_PATTERN = re.compile(r"^v(\d+)_\w+$")
+# PostgreSQL advisory lock 的 key，避免多個 process 同時執行 migration
+ADVISORY_LOCK_KEY = 4_211_048
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(255), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+)
+
+
+class SchemaAheadError(RuntimeError):
+    """資料庫的 schema 版本比程式碼中的 migration 新（例如部署了舊版程式）"""
+
+
+def discover_migrations():
+    """
+    依版本號排序列出所有 migration。
+
+    Returns:
+    - list: [(version, name, module)]。
+    """
+    migrations = []
+    for module_info in pkgutil.iter_modules([MIGRATIONS_DIRECTORY]):
+        match = MIGRATION_PATTERN.match(module_info.name)
+        if match is None:
+            continue
+        module = importlib.import_module(f"migrations.{module_info.name}")
+        migrations.append((int(match.group(1)), module_info.name, module))
+    migrations.sort(key=lambda migration: migration[0])
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {MIGRATIONS_DIRECTORY}")
+    return migrations
+
+
+def current_version(connection):
+    return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def migrate(app):
+    """
+    啟動時套用尚未執行的 migration，每個 migration 在各自的交易中執行並記錄版本。
+
+    migration 腳本只能使用自己定義的表結構快照，不可以引用 models，
+    全新的資料庫才能從 v001 依序重播整個歷史。導入 migration 前建立的資料庫
+    可能已經有部分的表或索引，因此建立表和索引時要加上 checkfirst / IF NOT EXISTS。
+
+    Raises:
+    - SchemaAheadError: 資料庫的版本比程式碼新，不應該繼續提供服務。
+    """
+    migrations = discover_migrations()
+    latest = migrations[-1][0] if migrations else 0
+
+    with app.app_context():
+        engine = db.engine
+        with engine.connect() as connection:
+            is_postgresql = connection.dialect.name == "postgresql"
+            if is_postgresql:
+                connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                connection.commit()
+            try:
+                with connection.begin():
+                    schema_version.create(bind=connection, checkfirst=True)
+                with connection.begin():
+                    version = current_version(connection)
+                if version > latest:
+                    raise SchemaAheadError(
+                        f"Database schema version {version} is newer than the latest migration {latest}"
+                    )
+
+                for migration_version, name, module in migrations:
+                    if migration_version <= version:
+                        continue
+                    logger.info(f"Applying schema migration {name}")
+                    with connection.begin():
+                        module.upgrade(connection)
+                        connection.execute(
+                            schema_version.insert().values(version=migration_version, name=name)
+                        )
+                    version = migration_version
+
+                logger.info(f"Database schema is at version {version}")
+                return version
+            finally:
+                if is_postgresql:
+                    connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                    connection.commit()
@@ -0,0 +1,174 @@
+import json
+import os
+from functools import lru_cache
+from operator import attrgetter
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # 沒有安裝 orjson 時使用標準函式庫
+    orjson = None
+
+# BASE_URL = "http://192.168.1.109:8080" # 安的IP
+BASE_URL = os.getenv("BASE_URL", "https://nccu-group-8.work")  # 主機IP
+
+
+def image_url(owner, filename):
+    """
+    組成圖片的網址。
+
+    Parameters:
+    - owner: 圖片所屬的使用者 ID，預設圖片為 'default'。
+    - filename (str): 圖片檔名。
+    """
+    return f"{BASE_URL}/userinfo/images/{owner}/{filename}"
+
+
+def avatar_url(user_id, photo_name):
+    """使用者頭像的網址，沒有上傳頭像時使用預設圖片"""
+    if not photo_name or photo_name == "avatar.png":
+        return image_url("default", "avatar.png")
+    return image_url(user_id, photo_name)
+
+
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def format_datetime(value, default="N/A"):
+    """模型狀態使用的 YYYY-MM-DD HH:MM:SS 格式"""
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value is not None else default
+
+
+class Serializer:
+    """
+    把 model 物件轉成 dict。
+
+    每個欄位定義為 回應欄位 -> (屬性名稱或取值函式, 格式化函式)；
+    同一組欄位的轉換函式只建立一次，之後每一筆資料只做屬性讀取和格式化。
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    @lru_cache(maxsize=64)
+    def _compile(self, names):
+        steps = []
+        for name in names:
+            attribute, formatter = self.fields[name]
+            getter = attribute if callable(attribute) else attrgetter(attribute)
+            steps.append((name, getter, formatter))
+
+        def serialize(obj):
+            return {
+                name: formatter(getter(obj)) if formatter else getter(obj)
+                for name, getter, formatter in steps
+            }
+
+        return serialize
+
+    def compile(self, names=None):
+        """取得只包含 names 欄位的轉換函式，None 表示所有欄位"""
+        return self._compile(tuple(names) if names else tuple(self.fields))
+
+    def __call__(self, obj, names=None, **extra):
+        data = self.compile(names)(obj)
+        data.update(extra)
+        return data
+
+    def many(self, objs, names=None):
+        serialize = self.compile(names)
+        return [serialize(obj) for obj in objs]
+
+
+event_serializer = Serializer(
+    {
+        "event_id": ("id", None),
+        "event_title": ("event_title", None),
+        "event_content": ("event_content", None),
+        "created_at": ("created_at", isoformat),
+        "updated_at": ("updated_at", isoformat),
+        "event_date": ("event_date", isoformat),
+        "event_picture": ("event_picture", lambda name: image_url("default", name)),
+    }
+)
+
+
+trained_model_serializer = Serializer(
+    {
+        "model_id": ("id", None),
+        "user_id": ("user_id", None),
+        "modelname": ("modelname", None),
+        "model_original_name": ("model_original_name", None),
+        "modelphoto": (lambda model: image_url(model.user_id, model.modelphoto), None),
+        "anticipation": ("anticipation", None),
+    }
+)
+
+
+def serialize_event(event, fields=None, **extra):
+    return event_serializer(event, fields, **extra)
+
+
+def serialize_trained_model(model, is_shared=False):
+    return trained_model_serializer(model, is_shared=is_shared)
+
+
+def serialize_model_status(training_file, trained_model, photo_name):
+    return {
+        "user_id": training_file.user_id,
+        "training_file_id": training_file.id,
+        "filename": training_file.filename,
+        "original_file_name": training_file.original_file_name,
+        "start_train": training_file.start_train,
+        "is_trained": training_file.is_trained,
+        "file_upload_time": format_datetime(training_file.upload_time),
+        "model_id": trained_model.id,
+        "model_name": trained_model.modelname,
+        "model_start_time": format_datetime(trained_model.start_time),
+        "model_end_time": format_datetime(trained_model.end_time),
+        "model_photo": image_url(training_file.user_id, photo_name),
+        "model_anticipation": trained_model.anticipation,
+    }
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    以 orjson 輸出 JSON 回應；沒有安裝 orjson 時行為和 Flask 預設相同。
+
+    orjson 無法處理的型別交給 Flask 預設的 default()。
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._orjson_dumps(obj).decode()
+
+    def _orjson_dumps(self, obj):
+        # datetime 交給 default()，輸出格式和 Flask 預設相同
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        # 直接使用 bytes，不需要再轉成 str
+        return self._app.response_class(
+            self._orjson_dumps(obj) + b"\n", mimetype=self.mimetype
+        )
+
+
+def dumps_line(obj):
+    """NDJSON 的一列"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode() + "\n"
+    return json.dumps(obj, ensure_ascii=False) + "\n"